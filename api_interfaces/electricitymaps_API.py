@@ -5,6 +5,14 @@ from constants import *
 def get_carbon_intensity(longitude, latitude):
     ''' Get the carbon emission factors of the geographic location associated to (longitude, latitude) by calling
         The Electricity Maps API'''
+    carbon_intensity_data = get_carbon_intensity_data(longitude, latitude)
+
+    return None if carbon_intensity_data is None else carbon_intensity_data['carbon_intensity']
+
+
+def get_carbon_intensity_data(longitude, latitude):
+    ''' Get the carbon emission factors of the geographic location associated to (longitude, latitude) by calling
+        The Electricity Maps API, together with the zone and the datetime (ISO 8601) of the measure'''
 
     # Set the URL for the Electricity Maps API
     url = ELECTRICITYMAPS_BASE_URL + '/v3/carbon-intensity/latest'
@@ -33,7 +41,7 @@ def get_carbon_intensity(longitude, latitude):
             carbon_intensity = data.get('carbonIntensity', None)
 
             if carbon_intensity is not None:
-                return carbon_intensity
+                return {'carbon_intensity': carbon_intensity, 'zone': data.get('zone', None), 'datetime': data.get('datetime', None)}
             else:
                 print("Carbon intensity data not available for this region.")
                 return None
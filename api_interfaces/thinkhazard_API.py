@@ -1,14 +1,50 @@
+import hashlib
 import requests
 import threading
+import time
+from collections import OrderedDict
 from risk_getters.enumerations import *
-from utility.cities_coordinates import find_closest_city
+from utility.circuit_breaker import CircuitBreaker
+from utility.versioned_reference import VersionedReference
+from utility.cities_coordinates import Gazetteer, find_closest_city
 from constants import *
 
 
 class ThinkHazardAPI:
-    def __init__(self):
+
+    # Seconds for which a fetched report is kept and considered up to date
+    REPORT_MAX_AGE = 86400
+
+    # Seconds to wait for the connection to the API and for its response
+    CONNECT_TIMEOUT = 3.05
+    READ_TIMEOUT = 10
+
+    # Seconds for which a failed request and an ADM2 code without report are remembered (and not requested again)
+    FAILURE_TTL = 60
+    NO_DATA_TTL = 600
+
+    # Maximum number of entries of each negative cache (the least recently used ones are dropped beyond it)
+    NO_DATA_CACHE_SIZE = 10000
+
+    def __init__(self, circuit_breaker: CircuitBreaker = None, gazetteer: Gazetteer = None):
         # current data mantains for a day the hazard risk indicators for a particular location given by (longitude, latitude)
         self.current_data = {} # Keys = (longitude, latitude) values = {risk_type : hazard_level,...}
+        self.adm2_codes = {} # Keys = (longitude, latitude) values = ADM2 code of the report
+
+        # Versions of the reports (their ETag, or the hash of their content if the API does not send it), checked again after REPORT_MAX_AGE seconds
+        self.report_versions = {} # Keys = ADM2 code values = (version, time at which it has been fetched)
+
+        # Gazetteer used to find the closest city (the default one of find_closest_city if None), swapped by reload_gazetteer
+        self.gazetteer = VersionedReference(gazetteer)
+
+        # Negative caches of the locations and the ADM2 codes without data (Keys = location or ADM2 code, values = expiration time),
+        # from the least to the most recently used
+        self.no_data_locations = OrderedDict()
+        self.no_data_adm2_codes = OrderedDict()
+        self.no_data_lock = threading.Lock()
+
+        # While the API is failing the requests fail fast to NO_DATA
+        self.circuit_breaker = CircuitBreaker() if circuit_breaker is None else circuit_breaker
 
     def get_risk_level(self, longitude: float, latitude: float, risk_type: EnvironmentalRiskType):
         ''' Return the risk level of a specific risk_type of the geographic location given by (latitude, longitude) by accessing the ThinkHazard API'''
@@ -16,33 +52,50 @@ class ThinkHazardAPI:
         # If data is not already available then fetch it from the API
         if  (longitude, latitude) not in self.current_data.keys():
 
+            # Skip the locations that recently had no data and fail fast while the API is unhealthy
+            if self._is_cached_no_data(self.no_data_locations, (longitude, latitude)) or not self.circuit_breaker.allow_request():
+                return EnvironmentalRisk.NO_DATA
+
             # Step 1: Find the closest city to the location given by (latitude, longitude) and get its ADM2 code
-            closest_city = find_closest_city(latitude, longitude)
+            with self.gazetteer.use() as gazetteer:
+                closest_city = find_closest_city(latitude, longitude) if gazetteer is None else gazetteer.find_closest_city(latitude, longitude)
 
             if closest_city:
                 adm2_code, city_name = closest_city
                 print(f"Closest City: {city_name}, ADM2 Code: {adm2_code}")
 
-                # Step 2: Use the ADM2 code to get hazard data from the ThinkHazard API
-                hazard_data = self._get_hazard_data(adm2_code)
+                # Step 2: Use the ADM2 code to get hazard data from the ThinkHazard API (unless it recently had no data)
+                if self._is_cached_no_data(self.no_data_adm2_codes, adm2_code):
+                    hazard_data = []
+                else:
+                    hazard_data = self._get_hazard_data(adm2_code)
 
                 # Step 3: extract and return the hazard level associated to the requested risk_type
                 if hazard_data:
                     hazard_dict = {HAZARD_TYPES_ENUM_MAP[item['hazardtype']['hazardtype']]: HAZARD_LEVEL_ENUM_MAP[item['hazardlevel']['title']] for item in hazard_data if item['hazardtype']['hazardtype'] in HAZARD_TYPES_ENUM_MAP.keys()}
                     self.current_data[(longitude, latitude)] =  hazard_dict
+                    self.adm2_codes[(longitude, latitude)] = adm2_code
 
-                    # Reset the current data for this location after 1 day
-                    timer = threading.Timer(86400, self.reset_value, [(longitude, latitude)])
+                    # Reset the current data for this location after 1 day (the timer does not keep the process alive)
+                    timer = threading.Timer(self.REPORT_MAX_AGE, self.reset_value, [(longitude, latitude)])
+                    timer.daemon = True
                     timer.start()
                     if not risk_type in hazard_dict.keys():
                         return EnvironmentalRisk.NO_DATA
                     else:
                         return hazard_dict[risk_type]
+                elif hazard_data is None:
+                    # The request failed, retry the location after a short time
+                    self._cache_no_data(self.no_data_locations, (longitude, latitude), time.monotonic() + self.FAILURE_TTL)
+                    return EnvironmentalRisk.NO_DATA
                 else:
-                    # No hazard data found.
+                    # No hazard data found for the ADM2 code, the location expires together with it
+                    expiration = self._cache_no_data(self.no_data_adm2_codes, adm2_code, time.monotonic() + self.NO_DATA_TTL)
+                    self._cache_no_data(self.no_data_locations, (longitude, latitude), expiration)
                     return EnvironmentalRisk.NO_DATA
             else:
                 # No closest city found
+                self._cache_no_data(self.no_data_locations, (longitude, latitude), time.monotonic() + self.NO_DATA_TTL)
                 return EnvironmentalRisk.NO_DATA
 
         else:
@@ -53,23 +106,133 @@ class ThinkHazardAPI:
 
     def reset_value(self, location):
         ''' Reset the value for a location after 1 day'''
-        del self.current_data[location]
+        self.current_data.pop(location, None)
+        self.adm2_codes.pop(location, None)
+
+    def reload_gazetteer(self, file_path: str = CITIES_WITH_COORDINATES, background: bool = False):
+        ''' Read the gazetteer at file_path and swap it in, the queries in progress finish with the old one. Only the reports of the locations
+            whose closest city now has a different ADM2 code are reset. If background is True the reload runs in a new thread, which is returned'''
+        if background:
+            thread = threading.Thread(target=self.reload_gazetteer, args=(file_path,), daemon=True)
+            thread.start()
+            return thread
+
+        gazetteer = Gazetteer(file_path)
+        self.gazetteer.swap(gazetteer)
+
+        for location, adm2_code in list(self.adm2_codes.items()):
+            closest_city = gazetteer.find_closest_city(location[1], location[0])
+            if closest_city is None or closest_city[0] != adm2_code:
+                self.reset_value(location)
+
+        # The locations without data may now have a closest city with data
+        with self.no_data_lock:
+            self.no_data_locations.clear()
+
+        return None
+
+    def get_report_version(self, longitude: float, latitude: float):
+        ''' Return the version of the report of the location given by (latitude, longitude) as [ADM2 code, version] (None if it is not available)'''
+        adm2_code = self.adm2_codes.get((longitude, latitude), None)
+        report_version = self.report_versions.get(adm2_code, None)
+
+        return None if report_version is None else [adm2_code, report_version[0]]
+
+    def is_report_current(self, version) -> bool:
+        ''' Return True if the report of the ADM2 code of version (returned by get_report_version) has not changed since. The current version
+            of each report is fetched again at most once every REPORT_MAX_AGE seconds. If the API cannot be reached the report is assumed unchanged'''
+        if version is None:
+            return False
+
+        adm2_code, report_version = version
+        current = self.report_versions.get(adm2_code, None)
+
+        if current is None or time.time() - current[1] >= self.REPORT_MAX_AGE:
+            if not self.circuit_breaker.allow_request():
+                return True
+
+            hazard_data = self._get_hazard_data(adm2_code)
+            if hazard_data is None:
+                return True
+            if not hazard_data:
+                # The report has been removed
+                return False
+
+            current = self.report_versions[adm2_code]
+
+        return current[0] == report_version
+
+    def _is_cached_no_data(self, negative_cache: OrderedDict, key) -> bool:
+        ''' Return True if key is in the negative cache and its entry has not expired (the expired entries are removed)'''
+        with self.no_data_lock:
+            expiration = negative_cache.get(key, None)
+            if expiration is None:
+                return False
+
+            if time.monotonic() >= expiration:
+                del negative_cache[key]
+                return False
+
+            negative_cache.move_to_end(key)
+            return True
+
+    def _cache_no_data(self, negative_cache: OrderedDict, key, expiration: float) -> float:
+        ''' Add key to the negative cache until expiration (an entry not yet expired keeps its own expiration, so that its time to live
+            is not extended by the later misses) and return the expiration of the entry. Beyond NO_DATA_CACHE_SIZE entries the least recently used are dropped'''
+        with self.no_data_lock:
+            current = negative_cache.get(key, None)
+            if current is not None and time.monotonic() < current:
+                expiration = current
+
+            negative_cache[key] = expiration
+            negative_cache.move_to_end(key)
+            while len(negative_cache) > self.NO_DATA_CACHE_SIZE:
+                negative_cache.popitem(last=False)
+
+        return expiration
+
+    def __getstate__(self):
+        # The lock is not sent to other processes, which create their own
+        state = self.__dict__.copy()
+        del state["no_data_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.no_data_lock = threading.Lock()
 
     def _get_hazard_data(self, adm2_code):
-        ''' Call the ThinkHazardAPI and return the hazard data'''
+        ''' Call the ThinkHazardAPI and return the hazard data, an empty list if there is no report for the ADM2 code and None if the request failed'''
         url = f"{THINKHAZARD_BASE_URL}/report/{adm2_code}.json"
 
         try:
             # Make the GET request to the ThinkHazard API
-            response = requests.get(url)
+            response = requests.get(url, timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
 
             # Check if the response is successful
             if response.status_code == 200:
-                # Return the JSON data
-                return response.json()
+                # Return the JSON data, keeping the version of the report
+                hazard_data = response.json()
+                self.report_versions[adm2_code] = (self._get_response_version(response), time.time())
+                self.circuit_breaker.record_success()
+                return hazard_data
+            elif response.status_code == 404:
+                # No report for ADM2 code {adm2_code}
+                self.circuit_breaker.record_success()
+                return []
             else:
                 # Failed to fetch hazard data for ADM2 code {adm2_code}
+                self.circuit_breaker.record_failure()
                 return None
         except Exception as e:
             # Error fetching hazard data for ADM2 code {adm2_code}
-            return None
\ No newline at end of file
+            self.circuit_breaker.record_failure()
+            return None
+
+    def _get_response_version(self, response) -> str:
+        ''' Return the version of a report: its ETag if the API sends it, the SHA-256 checksum of its content otherwise'''
+        etag = response.headers.get("ETag", None)
+        if etag:
+            return "etag:" + etag
+
+        return "sha256:" + hashlib.sha256(response.content).hexdigest()
@@ -0,0 +1,140 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable
+import numpy as np
+
+
+def estimate_size(data) -> int:
+    ''' Return an estimate of the memory (in bytes) used by a dataset: numpy arrays, (geo)pandas dataframes and series, and tuples, lists or dicts of them'''
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, (tuple, list)):
+        return sum(estimate_size(item) for item in data)
+    if isinstance(data, dict):
+        return sum(estimate_size(item) for item in data.values())
+
+    if hasattr(data, "memory_usage"):
+        size = int(np.sum(data.memory_usage(deep=True, index=True)))
+
+        # The geometries are python objects not measured by pandas: count their coordinates (2 doubles each) and a fixed overhead
+        geometries = getattr(data, "geometry", None)
+        if geometries is not None:
+            import shapely
+            size += int(shapely.get_num_coordinates(geometries.values).sum()) * 16 + len(geometries) * 100
+
+        return size
+
+    return sys.getsizeof(data)
+
+
+
+class DatasetManager:
+    ''' Keep the datasets of the map getters in memory within memory_budget bytes (no limit if None). The datasets are acquired by key
+        with the function loading them (from the local files returned by the FilePathLoader): when the budget is exceeded the least recently
+        used ones are evicted, and they are loaded again when acquired afterwards. The datasets are loaded outside the lock of the manager, so that
+        a long load does not block the other datasets, and the callers acquiring a dataset while it is loaded wait for that load'''
+
+    def __init__(self, memory_budget: int = None):
+        self.memory_budget = memory_budget
+
+        # Keys = dataset key values = (dataset, size), from the least to the most recently used
+        self.datasets = OrderedDict()
+        self.resident_size = 0
+        self.lock = threading.RLock()
+
+        # Loads in progress. Keys = dataset key values = future of the dataset
+        self.loading = {}
+
+        # Keys = dataset key values = {"size", "load_time", "loads", "hits", "evictions"}
+        self.stats = {}
+
+    def acquire(self, key, load: Callable):
+        ''' Return the dataset identified by key, loading it with load() if it is not in memory'''
+        with self.lock:
+            if key in self.datasets:
+                self.datasets.move_to_end(key)
+                self.stats[key]["hits"] += 1
+                return self.datasets[key][0]
+
+            # Wait for the load already in progress, if any
+            in_progress = self.loading.get(key, None)
+            if in_progress is None:
+                future = self.loading[key] = Future()
+
+        if in_progress is not None:
+            return in_progress.result()
+
+        try:
+            start = time.perf_counter()
+            dataset = load()
+            load_time = time.perf_counter() - start
+            size = estimate_size(dataset)
+        except BaseException as e:
+            with self.lock:
+                del self.loading[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            stats = self.stats.setdefault(key, {"size": 0, "load_time": 0.0, "loads": 0, "hits": 0, "evictions": 0})
+            stats["size"] = size
+            stats["load_time"] = load_time
+            stats["loads"] += 1
+
+            self.datasets[key] = (dataset, size)
+            self.resident_size += size
+            self._evict(keep=key)
+            del self.loading[key]
+
+        future.set_result(dataset)
+        return dataset
+
+    def release(self, key):
+        ''' Remove the dataset identified by key from memory'''
+        with self.lock:
+            if key in self.datasets:
+                _, size = self.datasets.pop(key)
+                self.resident_size -= size
+
+    def set_memory_budget(self, memory_budget: int):
+        ''' Change the memory budget, evicting the datasets that do not fit in it'''
+        with self.lock:
+            self.memory_budget = memory_budget
+            self._evict()
+
+    def get_stats(self) -> dict:
+        ''' Return the stats of each dataset acquired, with a flag telling whether it is in memory'''
+        with self.lock:
+            return {key: dict(stats, resident=key in self.datasets) for key, stats in self.stats.items()}
+
+    def _evict(self, keep=None):
+        ''' Evict the least recently used datasets (except keep) until the resident size is within the budget'''
+        if self.memory_budget is None:
+            return
+
+        for key in list(self.datasets.keys()):
+            if self.resident_size <= self.memory_budget:
+                break
+            if key != keep:
+                self.release(key)
+                self.stats[key]["evictions"] += 1
+
+    def __getstate__(self):
+        # The datasets are not sent to other processes, which load them again when needed
+        state = self.__dict__.copy()
+        state["datasets"] = OrderedDict()
+        state["resident_size"] = 0
+        state["loading"] = {}
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+
+# Dataset manager used by the map getters when none is given
+default_dataset_manager = DatasetManager()
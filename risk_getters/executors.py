@@ -0,0 +1,255 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
+from risk_getters.riskInterfaces import RiskGetter, RiskManager, get_majority_risk
+
+
+class SharedLayer:
+    ''' Class-encoded geometry layer (geometries, risk codes and a grid spatial index) stored in a single shared memory block.
+        Worker processes attach to the block by name and read the arrays without copying them'''
+
+    # Average number of features per cell of the grid index
+    FEATURES_PER_CELL = 4
+
+    def __init__(self, spec: dict, shm: shared_memory.SharedMemory):
+        self.spec = spec
+        self.shm = shm
+
+        # Zero-copy views of the arrays stored in the block
+        self.arrays = {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                       for name, (offset, dtype, shape) in spec['layout'].items()}
+
+        self.transformer = Transformer.from_crs("EPSG:4326", CRS.from_wkt(spec['crs']), always_xy=True)
+
+
+    @classmethod
+    def create(cls, geometries, codes: np.ndarray) -> "SharedLayer":
+        ''' Compile the geometries (a geopandas GeoSeries) and their codes into a new shared memory block'''
+        geometry_array = np.asarray(geometries.values, dtype=object)
+        wkb = shapely.to_wkb(geometry_array)
+        wkb_offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+        wkb_offsets[1:] = np.cumsum([len(item) for item in wkb])
+
+        bounds = shapely.bounds(geometry_array).astype(np.float64).reshape(-1, 4)
+        grid_size, extent, cell_offsets, cell_features = cls._build_grid_index(bounds)
+
+        arrays = {
+            'bounds': bounds,
+            'codes': np.asarray(codes, dtype=np.uint8),
+            'wkb_offsets': wkb_offsets,
+            'wkb': np.frombuffer(b"".join(wkb), dtype=np.uint8),
+            'cell_offsets': cell_offsets,
+            'cell_features': cell_features,
+        }
+
+        # Lay out the arrays one after the other in the block (8 bytes aligned)
+        layout = {}
+        size = 0
+        for name, array in arrays.items():
+            layout[name] = (size, array.dtype.str, array.shape)
+            size += math.ceil(array.nbytes / 8) * 8
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        spec = {'name': shm.name, 'layout': layout, 'crs': geometries.crs.to_wkt(), 'grid_size': grid_size, 'extent': extent}
+        layer = cls(spec, shm)
+        for name, array in arrays.items():
+            layer.arrays[name][...] = array
+
+        return layer
+
+
+    @classmethod
+    def attach(cls, spec: dict) -> "SharedLayer":
+        ''' Attach to the shared memory block described by spec (created by another process)'''
+        try:
+            shm = shared_memory.SharedMemory(name=spec['name'], track=False)
+        except TypeError:
+            # Python < 3.13 always tracks the block (the workers share the resource tracker of the creator process)
+            shm = shared_memory.SharedMemory(name=spec['name'])
+
+        return cls(spec, shm)
+
+
+    @classmethod
+    def _build_grid_index(cls, bounds: np.ndarray):
+        ''' Build a uniform grid index over the bounds of the features. Return the grid size, its extent and the features
+            of each cell in compressed form (cell_features[cell_offsets[cell]:cell_offsets[cell + 1]])'''
+        n = len(bounds)
+        if n == 0:
+            return 1, (0.0, 0.0, 0.0, 0.0), np.zeros(2, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        grid_size = max(1, int(math.sqrt(n / cls.FEATURES_PER_CELL)))
+        extent = (float(bounds[:, 0].min()), float(bounds[:, 1].min()), float(bounds[:, 2].max()), float(bounds[:, 3].max()))
+
+        # Range of cells covered by each feature
+        col_min, row_min = cls._cell_of(extent, grid_size, bounds[:, 0], bounds[:, 1])
+        col_max, row_max = cls._cell_of(extent, grid_size, bounds[:, 2], bounds[:, 3])
+        n_cols = col_max - col_min + 1
+        n_cells = n_cols * (row_max - row_min + 1)
+
+        # Expand every feature into the list of the cells it covers
+        features = np.repeat(np.arange(n, dtype=np.int64), n_cells)
+        position = np.arange(n_cells.sum()) - np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+        cols = np.repeat(col_min, n_cells) + position % np.repeat(n_cols, n_cells)
+        rows = np.repeat(row_min, n_cells) + position // np.repeat(n_cols, n_cells)
+        cells = rows * grid_size + cols
+
+        order = np.argsort(cells, kind="stable")
+        cell_offsets = np.searchsorted(cells[order], np.arange(grid_size * grid_size + 1)).astype(np.int64)
+
+        return grid_size, extent, cell_offsets, features[order]
+
+
+    @staticmethod
+    def _cell_of(extent: tuple, grid_size: int, x, y):
+        ''' Return the (clipped) column and row of the grid cells containing the coordinates x, y'''
+        min_x, min_y, max_x, max_y = extent
+        cell_width = (max_x - min_x) / grid_size or 1.0
+        cell_height = (max_y - min_y) / grid_size or 1.0
+
+        col = np.clip(np.floor((np.asarray(x) - min_x) / cell_width), 0, grid_size - 1).astype(np.int64)
+        row = np.clip(np.floor((np.asarray(y) - min_y) / cell_height), 0, grid_size - 1).astype(np.int64)
+        return col, row
+
+
+    def query(self, geometry) -> np.ndarray:
+        ''' Return the indices of the features intersecting the geometry (given in the reference system of the layer)'''
+        min_x, min_y, max_x, max_y = shapely.bounds(geometry)
+        grid_size = self.spec['grid_size']
+        cell_offsets = self.arrays['cell_offsets']
+        cell_features = self.arrays['cell_features']
+
+        # Candidates from the grid cells covered by the geometry
+        (col_min, col_max), (row_min, row_max) = (np.sort(c) for c in self._cell_of(self.spec['extent'], grid_size, [min_x, max_x], [min_y, max_y]))
+        candidates = [cell_features[cell_offsets[row * grid_size + col_min]:cell_offsets[row * grid_size + col_max + 1]]
+                      for row in range(row_min, row_max + 1)]
+        candidates = np.unique(np.concatenate(candidates))
+
+        # Bounding box filter followed by the exact test on the decoded candidates
+        bounds = self.arrays['bounds'][candidates]
+        candidates = candidates[(bounds[:, 0] <= max_x) & (bounds[:, 2] >= min_x) & (bounds[:, 1] <= max_y) & (bounds[:, 3] >= min_y)]
+        if len(candidates) == 0:
+            return candidates
+
+        wkb = self.arrays['wkb']
+        wkb_offsets = self.arrays['wkb_offsets']
+        geometries = shapely.from_wkb([wkb[wkb_offsets[i]:wkb_offsets[i + 1]].tobytes() for i in candidates])
+
+        return candidates[shapely.intersects(geometries, geometry)]
+
+
+    def get_bounding_box(self, longitude: float, latitude: float):
+        ''' Return the rectangular bounding box surrounding the geographic location given by (latitude, longitude) in the reference system of the layer'''
+        bounding_box = shapely.box(longitude - 0.01, latitude - 0.01, longitude + 0.01, latitude + 0.01)
+        return shapely.transform(bounding_box, lambda coords: np.column_stack(self.transformer.transform(coords[:, 0], coords[:, 1])))
+
+
+    def close(self):
+        ''' Release the views and detach from the shared memory block'''
+        self.arrays = {}
+        self.shm.close()
+
+
+    def unlink(self):
+        ''' Destroy the shared memory block (only the creator process should call it)'''
+        self.shm.unlink()
+
+
+
+class SharedLayerRiskGetter(RiskGetter):
+    ''' Worker side getter that returns the risk by majority voting over a SharedLayer, as FloodRiskMap and LandslideRiskMap do'''
+
+    def __init__(self, spec: dict):
+        self.spec = spec
+        self.layer = None
+
+    def __getstate__(self):
+        # Only the description of the block is sent to the workers
+        return {'spec': self.spec, 'layer': None}
+
+    def get_risk(self, longitude: float, latitude: float) -> EnvironmentalRisk:
+        ''' Return the risk by intersecting the shared layer with a bounding box surrounding the geographic location given by (latitude, longitude) and using majority voting based on the number of matches'''
+        if self.layer is None:
+            self.layer = SharedLayer.attach(self.spec)
+
+        hits = self.layer.query(self.layer.get_bounding_box(longitude, latitude))
+        return get_majority_risk(self.layer.arrays['codes'][hits])
+
+
+
+# Risk manager of the worker process, built once by the pool initializer
+_worker_risk_manager = None
+
+def _init_worker(risk_getters_per_type: dict[EnvironmentalRiskType, list[RiskGetter]]):
+    global _worker_risk_manager
+    _worker_risk_manager = RiskManager(risk_getters_per_type)
+
+def _evaluate_chunk(locations: list[tuple[float, float]]) -> list[dict[EnvironmentalRiskType, EnvironmentalRisk]]:
+    return _worker_risk_manager.get_indicators_batch(locations)
+
+
+
+class ProcessPoolRiskExecutor:
+    ''' Evaluate the getters of a RiskManager over batches of locations with a pool of worker processes.
+        The map getters exposing get_encoded_layer (FloodRiskMap, LandslideRiskMap) are compiled once into shared memory
+        and replaced in the workers by getters attached to it, so the GeoDataFrames are neither pickled nor copied per process.
+        The other getters are sent to each worker as they are'''
+
+    def __init__(self, risk_manager: RiskManager, max_workers: int = None, chunk_size: int = 256, mp_context=None):
+        self.chunk_size = chunk_size
+        self.shared_layers = []
+
+        worker_getters_per_type = {risk_type: [self._share(getter) for getter in getters]
+                                   for risk_type, getters in risk_manager.risk_getters_per_type.items()}
+
+        # Spawn the workers by default, forking would duplicate the memory of the parent process
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context or multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(worker_getters_per_type,))
+
+
+    def _share(self, getter: RiskGetter) -> RiskGetter:
+        ''' Return the getter to be used by the workers in place of getter'''
+        if not hasattr(getter, "get_encoded_layer"):
+            return getter
+
+        # The same getter can appear under several risk types
+        for shared_getter, layer in self.shared_layers:
+            if shared_getter is getter:
+                return SharedLayerRiskGetter(layer.spec)
+
+        geometries, codes = getter.get_encoded_layer()
+        layer = SharedLayer.create(geometries, codes)
+        self.shared_layers.append((getter, layer))
+        return SharedLayerRiskGetter(layer.spec)
+
+
+    def get_indicators_batch(self, locations: list[tuple[float, float]]) -> list[dict[EnvironmentalRiskType, EnvironmentalRisk]]:
+        ''' Return the risk indicators for each (longitude, latitude) location of the batch, in input order'''
+        locations = list(locations)
+        chunks = [locations[i:i + self.chunk_size] for i in range(0, len(locations), self.chunk_size)]
+
+        result = []
+        for chunk_result in self.pool.map(_evaluate_chunk, chunks):
+            result.extend(chunk_result)
+
+        return result
+
+
+    def close(self):
+        ''' Stop the workers and destroy the shared memory blocks'''
+        self.pool.shutdown()
+        for _, layer in self.shared_layers:
+            layer.close()
+            layer.unlink()
+        self.shared_layers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,13 +1,18 @@
-import geopandas as gpd
+from __future__ import annotations
+import hashlib
+import numpy as np
 from abc import ABC
-import matplotlib.pyplot as plt
-from numpy.ma.core import argmax
-from shapely.geometry import Polygon, Point
+from typing import TYPE_CHECKING, Iterator
+from risk_getters.dataset_manager import DatasetManager, default_dataset_manager
 from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
 from risk_getters.riskInterfaces import RiskGetter
 from api_interfaces.thinkhazard_API import ThinkHazardAPI
 from utility.loaders import FilePathLoader
 
+# The geospatial libraries are imported when first used, to keep the import of the getters fast
+if TYPE_CHECKING:
+    import geopandas as gpd
+
 class FloodRiskGetter(RiskGetter, ABC):
     pass
 
@@ -16,16 +21,64 @@ class FloodRiskGetter(RiskGetter, ABC):
 class FloodRiskMap(FloodRiskGetter):
     ''' Class that return the flood risk indicator for a specific location using 3 shapefile representing the low, medium and high risk geographic map areas '''
 
-    def __init__(self, file_data_low: str, file_data_medium: str, file_data_high: str, file_path_loader : FilePathLoader):
-        self.map_low = gpd.read_file(file_path_loader.load_path(file_data_low))
-        self.map_medium = gpd.read_file(file_path_loader.load_path(file_data_medium))
-        self.map_high = gpd.read_file(file_path_loader.load_path(file_data_high))
+    def __init__(self, file_data_low: str, file_data_medium: str, file_data_high: str, file_path_loader : FilePathLoader, bounds: tuple = None, dataset_manager: DatasetManager = None):
+        self.file_path_loader = file_path_loader
+
+        # The 3 maps are loaded concurrently if the loader supports it
+        self.map_paths = file_path_loader.load_paths([file_data_low, file_data_medium, file_data_high])
+
+        # If bounds (min_longitude, min_latitude, max_longitude, max_latitude) are given only the areas intersecting them are loaded
+        self.bounds = bounds
+
+        # Checksum of the 3 maps (computed when first requested)
+        self.data_version = None
+
+        # The 3 maps are kept in memory by the dataset manager, which may evict them and load them again when needed. Their keys include
+        # the signature of the files, so that a replaced map is not confused with the one in memory
+        self.dataset_manager = default_dataset_manager if dataset_manager is None else dataset_manager
+        self.dataset_keys = [(type(self).__name__, map_path, bounds, file_path_loader.get_signature(map_path)) for map_path in self.map_paths]
+        for i in range(len(self.map_paths)):
+            self._get_map(i)
+
+
+    @property
+    def map_low(self) -> gpd.GeoDataFrame:
+        return self._get_map(0)
+
+    @property
+    def map_medium(self) -> gpd.GeoDataFrame:
+        return self._get_map(1)
+
+    @property
+    def map_high(self) -> gpd.GeoDataFrame:
+        return self._get_map(2)
+
+
+    def get_dataset_keys(self) -> list:
+        ''' Return the keys of the datasets of the getter in the dataset manager'''
+        return list(self.dataset_keys)
 
+    def _get_map(self, index: int) -> gpd.GeoDataFrame:
+        ''' Return the map at index (0 low, 1 medium, 2 high) from the dataset manager'''
+        return self.dataset_manager.acquire(self.dataset_keys[index], lambda: self._load_map(self.map_paths[index]))
+
+    def _load_map(self, map_path: str) -> gpd.GeoDataFrame:
+        ''' Read a map and build its spatial index'''
+        import geopandas as gpd
+        from risk_getters.region_query import get_bounds_series
+
+        bbox = None if self.bounds is None else get_bounds_series(self.bounds)
+        map = gpd.read_file(map_path, bbox=bbox)
+        map.sindex
+
+        return map
 
 
     def get_risk(self, longitude: float, latitude: float) -> EnvironmentalRisk:
         ''' Return the flood risk by joining the 3 maps with a bounding box surrounding the geographic location given by (latitude, longitude) and using majority voting based on the number of matches'''
 
+        import geopandas as gpd
+
         bounding_box_gdf = self._get_bounding_box_dataframe(longitude, latitude)
 
         # Perform a spatial join with the three maps
@@ -39,7 +92,7 @@ class FloodRiskMap(FloodRiskGetter):
             return EnvironmentalRisk.NO_DATA
         else:
             votes = [len(r) for r in result]
-            index_max = argmax(votes)
+            index_max = np.argmax(votes)
             if index_max == 0:
                 return EnvironmentalRisk.LOW
             elif index_max == 1:
@@ -48,8 +101,27 @@ class FloodRiskMap(FloodRiskGetter):
                 return EnvironmentalRisk.HIGH
 
 
+    def get_data_version(self, longitude: float, latitude: float) -> str:
+        ''' Return the checksum of the 3 maps'''
+        return self._get_checksum()
+
+    def _get_checksum(self) -> str:
+        ''' Return the checksum of the 3 maps, computed when first requested'''
+        if self.data_version is None:
+            self.data_version = hashlib.sha256("".join(self.file_path_loader.get_checksum(path) for path in self.map_paths).encode()).hexdigest()
+
+        return self.data_version
+
+    def is_data_current(self, version) -> bool:
+        ''' Return True if the risk has been computed with the current maps'''
+        return version == self._get_checksum()
+
+
     def _get_bounding_box_dataframe(self, longitude: float, latitude: float) -> gpd.GeoDataFrame:
         '''Create a rectangular bounding box surrounding the geographic location given by (latitude, longitude) an return it as a geopandas geodataframe'''
+        import geopandas as gpd
+        from shapely.geometry import Polygon
+
         bounding_box_coords = [(longitude - 0.01, latitude - 0.01),  # Bottom-left (Longitude, Latitude)
                                (longitude + 0.01, latitude - 0.01),  # Bottom-right (Longitude, Latitude)
                                (longitude + 0.01, latitude + 0.01),  # Top-right (Longitude, Latitude)
@@ -67,31 +139,55 @@ class FloodRiskMap(FloodRiskGetter):
         return bounding_box_gdf
 
 
-    def plot(self, longitude: float, latitude: float):
-        ''' Get the risk associated to the location given by (latitude, longitude) and plot the map of that risk level and the location'''
+    def get_encoded_layer(self) -> tuple[gpd.GeoSeries, np.ndarray]:
+        ''' Return the geometries of the 3 maps (in the reference system of the low risk map) and the risk level of each geometry encoded as EnvironmentalRisk values'''
+        import geopandas as gpd
+        import pandas as pd
+
+        layers = [(self.map_low, EnvironmentalRisk.LOW), (self.map_medium, EnvironmentalRisk.MEDIUM), (self.map_high, EnvironmentalRisk.HIGH)]
+
+        geometries = pd.concat([layer.geometry.to_crs(self.map_low.crs) for layer, _ in layers], ignore_index=True)
+        codes = np.concatenate([np.full(len(layer), risk.value, dtype=np.uint8) for layer, risk in layers])
+
+        return gpd.GeoSeries(geometries, crs=self.map_low.crs), codes
+
+
+    def get_footprint_stats(self, footprints) -> list[dict]:
+        ''' Return the risk statistics of each footprint (shapely polygons, lines or points in EPSG:4326): the fraction of its area (length for the lines)
+            covered by each of the 3 maps, and the risk level covering the largest part. The maps are all measured in the same equal-area reference
+            system (see get_vector_footprint_weights) and may overlap, so the fractions may sum to more than 1'''
+        import geopandas as gpd
+        from risk_getters.footprints import get_footprint_stats_from_weights, get_vector_footprint_weights
+
+        footprints = gpd.GeoSeries(list(footprints), crs="EPSG:4326")
+        layers = [(self.map_low, EnvironmentalRisk.LOW), (self.map_medium, EnvironmentalRisk.MEDIUM), (self.map_high, EnvironmentalRisk.HIGH)]
+
+        weights = np.zeros((len(footprints), len(EnvironmentalRisk)))
+        for layer, risk in layers:
+            layer_weights, totals = get_vector_footprint_weights(layer.geometry, np.full(len(layer), risk.value, dtype=np.uint8), footprints)
+            weights += layer_weights
+
+        return get_footprint_stats_from_weights(weights, totals)
 
-        risk = self.get_risk(longitude, latitude)
 
-        # Create the point associated to the location
-        point = Point(longitude, latitude)
-        point_gdf = gpd.GeoDataFrame(index=[0], crs="EPSG:4326", geometry=[point])
+    def iter_areas(self, area, min_risk: EnvironmentalRisk, chunk_size: int = 1000) -> Iterator[dict]:
+        ''' Yield the GeoJSON features of the areas of the maps, clipped to area (a bounding box (min_longitude, min_latitude, max_longitude, max_latitude)
+            or a shapely geometry), whose risk is at least min_risk. Only the maps of those risk levels are queried, through their spatial index'''
+        from risk_getters.region_query import iter_vector_features
 
-        # Adjust the reference system
-        point_gdf = point_gdf.to_crs(self.map_low.crs)
+        layers = [(self.map_low, EnvironmentalRisk.LOW), (self.map_medium, EnvironmentalRisk.MEDIUM), (self.map_high, EnvironmentalRisk.HIGH)]
 
-        # Plot the shapefile
-        ax = None
-        if risk == EnvironmentalRisk.VERY_LOW or risk == EnvironmentalRisk.LOW or EnvironmentalRisk.NO_DATA:
-            ax = self.map_low.plot(color='lightblue', figsize=(10, 10))
-        elif risk == EnvironmentalRisk.MEDIUM:
-            ax = self.map_medium.plot(color='lightblue', figsize=(10, 10))
-        elif risk == EnvironmentalRisk.HIGH:
-            ax = self.map_high.plot(color='lightblue', figsize=(10, 10))
+        for layer, risk in layers:
+            if risk.value >= min_risk.value:
+                codes = np.full(len(layer), risk.value, dtype=np.uint8)
+                yield from iter_vector_features(layer.geometry, codes, area, min_risk, EnvironmentalRiskType.FLOOD_RIVER_RISK, chunk_size)
 
-        # Plot the point
-        point_gdf.plot(ax=ax, color='red', markersize=50)
-        plt.title("Shapefile and Point Location")
-        plt.show()
+
+    def plot(self, longitude: float, latitude: float):
+        ''' Get the risk associated to the location given by (latitude, longitude) and plot the map of that risk level and the location'''
+        from risk_getters.visualization import plot_flood_map
+
+        plot_flood_map(self, longitude, latitude)
 
 
 
@@ -110,6 +206,15 @@ class RiverFloodRiskThAPI(FloodRiskGetter):
 
         return risk
 
+
+    def get_data_version(self, longitude: float, latitude: float):
+        ''' Return the version (ADM2 code and ETag or content hash) of the ThinkHazard report of the location'''
+        return self.api.get_report_version(longitude, latitude)
+
+    def is_data_current(self, version) -> bool:
+        ''' Return True if the ThinkHazard report has not changed since version'''
+        return self.api.is_report_current(version)
+
 class UrbanFloodRiskThAPI(FloodRiskGetter):
     ''' Class that return the flood risk by accessing the ThinkHazard API'''
 
@@ -125,3 +230,12 @@ class UrbanFloodRiskThAPI(FloodRiskGetter):
         return risk
 
 
+    def get_data_version(self, longitude: float, latitude: float):
+        ''' Return the version (ADM2 code and ETag or content hash) of the ThinkHazard report of the location'''
+        return self.api.get_report_version(longitude, latitude)
+
+    def is_data_current(self, version) -> bool:
+        ''' Return True if the ThinkHazard report has not changed since version'''
+        return self.api.is_report_current(version)
+
+
@@ -0,0 +1,55 @@
+import numpy as np
+from risk_getters.enumerations import EnvironmentalRisk
+
+# Equal-area reference system in which the footprints and their intersections with the maps are measured, so that the measures taken
+# on maps in different reference systems can be added together
+EQUAL_AREA_CRS = "EPSG:6933"
+
+
+def make_footprint_stats(risk: EnvironmentalRisk, distribution: dict[EnvironmentalRisk, float]) -> dict:
+    ''' Return the risk statistics of a footprint: its risk level and the fraction of the footprint covered by each risk level'''
+    return {"risk": risk, "distribution": distribution}
+
+
+def get_footprint_stats_from_weights(weights: np.ndarray, totals: np.ndarray) -> list[dict]:
+    ''' Return the risk statistics of each footprint given the (number of footprints, number of risk levels) array of the measures (area, length, ...)
+        covered by each risk level and the total measure of each footprint. The part not covered by any level is counted as NO_DATA and the
+        risk level is the one covering the largest part of the footprint (ties are resolved in favour of the lowest level)'''
+    weights = np.array(weights, dtype=float)
+    totals = np.asarray(totals, dtype=float)
+
+    covered = weights[:, 1:].sum(axis=1)
+    weights[:, 0] += np.maximum(totals - covered - weights[:, 0], 0)
+
+    fractions = weights / np.where(totals > 0, totals, np.maximum(weights.sum(axis=1), 1))[:, None]
+    levels = np.where(covered > 0, np.argmax(weights[:, 1:], axis=1) + 1, EnvironmentalRisk.NO_DATA.value)
+
+    return [make_footprint_stats(EnvironmentalRisk(int(level)), {EnvironmentalRisk(value): float(fraction) for value, fraction in enumerate(row) if fraction > 0})
+            for level, row in zip(levels, fractions)]
+
+
+def get_vector_footprint_weights(geometries, codes: np.ndarray, footprints) -> tuple[np.ndarray, np.ndarray]:
+    ''' Return the (number of footprints, number of risk levels) array of the measures of the footprints (a geopandas GeoSeries in EPSG:4326) covered
+        by the geometries (an indexed GeoSeries) with each risk level (given as EnvironmentalRisk values in codes), and the total measure of each footprint.
+        All the intersecting pairs are found with a single query of the spatial index and measured together in EQUAL_AREA_CRS: areas for the polygons,
+        lengths for the lines and the number of matches for the points. Overlapping geometries are counted once each, so the measures may exceed the total'''
+    import geopandas as gpd
+    import shapely
+
+    measured_footprints = footprints.to_crs(EQUAL_AREA_CRS).values
+    footprints = footprints.to_crs(geometries.crs).values
+    footprint_index, geometry_index = geometries.sindex.query(footprints, predicate="intersects")
+
+    dimensions = shapely.get_dimensions(footprints)
+    totals = np.where(dimensions == 2, shapely.area(measured_footprints), np.where(dimensions == 1, shapely.length(measured_footprints), 0))
+
+    intersections = shapely.intersection(footprints[footprint_index], geometries.values[geometry_index])
+    intersections = gpd.GeoSeries(intersections, crs=geometries.crs).to_crs(EQUAL_AREA_CRS).values
+    pair_dimensions = dimensions[footprint_index]
+    measures = np.where(pair_dimensions == 2, shapely.area(intersections), np.where(pair_dimensions == 1, shapely.length(intersections), 1))
+
+    n_levels = len(EnvironmentalRisk)
+    weights = np.bincount(footprint_index * n_levels + codes[geometry_index], weights=measures,
+                          minlength=len(footprints) * n_levels).reshape(len(footprints), n_levels)
+
+    return weights, totals
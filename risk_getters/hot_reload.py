@@ -0,0 +1,87 @@
+import threading
+from typing import Callable
+from risk_getters.enumerations import EnvironmentalRisk
+from risk_getters.riskInterfaces import RiskGetter
+from utility.versioned_reference import VersionedReference
+
+
+class HotReloadRiskGetter(RiskGetter):
+    ''' Risk getter whose underlying getter (e.g. a FloodRiskMap), built by build(), can be reloaded without interrupting the queries. The new
+        getter is built (through its FilePathLoader) while the old one keeps answering, then it is swapped in and, once the queries using the old one
+        are over, the datasets of the old getter that the new one does not share are released from the dataset manager. The methods of the map getters
+        (FORWARDED_METHODS) are forwarded to the current getter if it provides them, so that the wrapper is used in their place (e.g. by
+        ProcessPoolRiskExecutor and iter_hazard_features)'''
+
+    FORWARDED_METHODS = ("get_risks", "get_encoded_layer", "iter_areas", "get_dataset_keys")
+
+    def __init__(self, build: Callable[[], RiskGetter]):
+        self.build = build
+        self.getter = VersionedReference(build())
+        self.reload_lock = threading.Lock()
+
+    def get_risk(self, longitude: float, latitude: float) -> EnvironmentalRisk:
+        with self.getter.use() as getter:
+            return getter.get_risk(longitude, latitude)
+
+    def get_data_version(self, longitude: float, latitude: float):
+        with self.getter.use() as getter:
+            return getter.get_data_version(longitude, latitude)
+
+    def is_data_current(self, version) -> bool:
+        with self.getter.use() as getter:
+            return getter.is_data_current(version)
+
+    def get_footprint_stats(self, footprints) -> list[dict]:
+        with self.getter.use() as getter:
+            return getter.get_footprint_stats(footprints)
+
+    def __getattr__(self, name: str):
+        # Called only for the attributes not found on the wrapper: forward the methods of the map getters provided by the current getter
+        if name not in self.FORWARDED_METHODS or "getter" not in self.__dict__:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        with self.getter.use() as getter:
+            if not hasattr(getter, name):
+                raise AttributeError(f"'{type(getter).__name__}' object has no attribute '{name}'")
+
+        if name == "iter_areas":
+            return self._iter_areas
+
+        def forward(*args, **kwargs):
+            with self.getter.use() as getter:
+                return getattr(getter, name)(*args, **kwargs)
+
+        return forward
+
+    def _iter_areas(self, *args, **kwargs):
+        # The getter is not retired until the iteration is over
+        with self.getter.use() as getter:
+            yield from getter.iter_areas(*args, **kwargs)
+
+    def reload(self, background: bool = False, timeout: float = None):
+        ''' Build a new getter and swap it in. If background is True the reload runs in a new thread, which is returned'''
+        if background:
+            thread = threading.Thread(target=self.reload, kwargs={"timeout": timeout}, daemon=True)
+            thread.start()
+            return thread
+
+        # A single reload at a time
+        with self.reload_lock:
+            new_getter = self.build()
+            old_getter = self.getter.swap(new_getter, timeout)
+
+            # Release the datasets of the replaced files only (the unchanged ones are shared with the new getter)
+            if hasattr(old_getter, "get_dataset_keys"):
+                for key in set(old_getter.get_dataset_keys()) - set(new_getter.get_dataset_keys()):
+                    old_getter.dataset_manager.release(key)
+
+        return None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["reload_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reload_lock = threading.Lock()
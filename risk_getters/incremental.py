@@ -0,0 +1,119 @@
+import json
+import os
+import time
+from datetime import datetime
+from api_interfaces.electricitymaps_API import get_carbon_intensity_data
+from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
+from risk_getters.riskInterfaces import RiskGetter, RiskManager
+
+
+class ResultStore:
+    ''' Store of the evaluated locations saved as a json file. For each location it keeps the risk level of each risk type, together
+        with the data versions of the getters consulted to compute it, and the last carbon intensity measure'''
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+        # Keys = "longitude,latitude" values = {"indicators": {risk_type_name: {"level": ..., "versions": [[getter_name, version],...]}}, "carbon": {...}}
+        self.entries = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as json_file:
+                self.entries = json.load(json_file)
+
+    def get_entry(self, longitude: float, latitude: float) -> dict:
+        ''' Return the (possibly new and empty) entry of the location given by (longitude, latitude)'''
+        return self.entries.setdefault(f"{longitude},{latitude}", {"indicators": {}, "carbon": None})
+
+    def save(self):
+        ''' Write the store on its file (the file is replaced only once completely written)'''
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, 'w') as json_file:
+            json.dump(self.entries, json_file)
+        os.replace(temp_path, self.file_path)
+
+
+
+class IncrementalEvaluator:
+    ''' Evaluate locations reusing the results of a ResultStore whose inputs did not change. A risk type is evaluated again only if the
+        data version (ThinkHazard report ETag or content hash, dataset checksum) of one of the getters consulted for it is no longer current,
+        the carbon intensity only if the measure stored is older than carbon_max_age seconds'''
+
+    def __init__(self, risk_manager: RiskManager, store: ResultStore, carbon_max_age: float = 3600, carbon_intensity_getter=get_carbon_intensity_data):
+        self.risk_manager = risk_manager
+        self.store = store
+        self.carbon_max_age = carbon_max_age
+        self.carbon_intensity_getter = carbon_intensity_getter
+
+        # Number of risk indicators and carbon intensities reused from the store or computed again
+        self.stats = {"reused": 0, "recomputed": 0}
+
+    def get_indicators(self, longitude: float, latitude: float) -> dict[EnvironmentalRiskType, EnvironmentalRisk]:
+        ''' Return the risk indicators of the location given by (longitude, latitude), evaluating only the risk types whose inputs changed'''
+        entry = self.store.get_entry(longitude, latitude)
+
+        result = {}
+        for risk_type, getters in self.risk_manager.risk_getters_per_type.items():
+            stored = entry["indicators"].get(risk_type.name, None)
+
+            if stored is not None and self._is_current(getters, stored["versions"]):
+                result[risk_type] = EnvironmentalRisk(stored["level"])
+                self.stats["reused"] += 1
+            else:
+                risk, versions = self._get_indicator_with_versions(getters, longitude, latitude)
+                entry["indicators"][risk_type.name] = {"level": risk.value,
+                                                       "versions": [[type(getter).__name__, version] for getter, version in zip(getters, versions)]}
+                result[risk_type] = risk
+                self.stats["recomputed"] += 1
+
+        return result
+
+    def get_carbon_intensity(self, longitude: float, latitude: float):
+        ''' Return the carbon intensity of the location given by (longitude, latitude), calling the Electricity Maps API only if the stored measure is outdated'''
+        entry = self.store.get_entry(longitude, latitude)
+
+        if entry["carbon"] is not None and self._is_carbon_current(entry["carbon"]["datetime"]):
+            self.stats["reused"] += 1
+            return entry["carbon"]["carbon_intensity"]
+
+        self.stats["recomputed"] += 1
+        carbon_intensity_data = self.carbon_intensity_getter(longitude, latitude)
+        if carbon_intensity_data is None:
+            return None
+
+        entry["carbon"] = carbon_intensity_data
+        return carbon_intensity_data["carbon_intensity"]
+
+    def evaluate_batch(self, locations: list[tuple[float, float]]) -> list[tuple[dict[EnvironmentalRiskType, EnvironmentalRisk], float]]:
+        ''' Return the risk indicators and the carbon intensity of each (longitude, latitude) location, in input order, and save the store'''
+        result = [(self.get_indicators(longitude, latitude), self.get_carbon_intensity(longitude, latitude)) for longitude, latitude in locations]
+        self.store.save()
+
+        return result
+
+    def _get_indicator_with_versions(self, getters: list[RiskGetter], longitude: float, latitude: float) -> tuple[EnvironmentalRisk, list]:
+        ''' Return the risk indicator given by the getters (as RiskManager.get_indicators does) for the location given by (longitude, latitude),
+            together with the data versions of the getters consulted (in order) to obtain it'''
+        versions = []
+        for getter in getters:
+
+            risk_indicator = getter.get_risk(longitude, latitude)
+            versions.append(getter.get_data_version(longitude, latitude))
+
+            if risk_indicator != EnvironmentalRisk.NO_DATA:
+                return risk_indicator, versions
+
+        return EnvironmentalRisk.NO_DATA, versions
+
+    def _is_current(self, getters: list[RiskGetter], versions: list) -> bool:
+        ''' Return True if the stored versions belong to the same getters and are all still current'''
+        if not versions or len(versions) > len(getters):
+            return False
+
+        return all(type(getter).__name__ == getter_name and getter.is_data_current(version) for getter, (getter_name, version) in zip(getters, versions))
+
+    def _is_carbon_current(self, measure_datetime: str) -> bool:
+        ''' Return True if the carbon intensity measured at measure_datetime (ISO 8601) is not older than carbon_max_age'''
+        if measure_datetime is None:
+            return False
+
+        return time.time() - datetime.fromisoformat(measure_datetime).timestamp() < self.carbon_max_age
@@ -1,14 +1,17 @@
+from __future__ import annotations
 from abc import ABC
-import geopandas as gpd
-import pandas as pd
-import matplotlib.pyplot as plt
-from numpy.ma.core import argmax
-from shapely.geometry import Polygon, Point
+from typing import TYPE_CHECKING, Iterator
+import numpy as np
 from utility.loaders import FilePathLoader
 from api_interfaces.thinkhazard_API import ThinkHazardAPI
+from risk_getters.dataset_manager import DatasetManager, default_dataset_manager
 from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
 from risk_getters.riskInterfaces import RiskGetter
 
+# The geospatial libraries are imported when first used, to keep the import of the getters fast
+if TYPE_CHECKING:
+    import geopandas as gpd
+
 
 class LandslideRiskGetter(RiskGetter, ABC):
     pass
@@ -16,82 +19,160 @@ class LandslideRiskGetter(RiskGetter, ABC):
 class LandslideRiskMap(LandslideRiskGetter):
     ''' Return the landslide risk indicator for a specific location using a shapefile representing the geographic map areas and associated risk values'''
 
-    def __init__(self, file_data: dict, file_path_loader: FilePathLoader):
+    def __init__(self, file_data: dict, file_path_loader: FilePathLoader, bounds: tuple = None, weight_by_area: bool = False, dataset_manager: DatasetManager = None):
+        self.file_path_loader = file_path_loader
+        self.map_path = file_path_loader.load_path(file_data)
 
-        # Get the geodataframe
-        self.map = gpd.read_file(file_path_loader.load_path(file_data))
+        # If bounds (min_longitude, min_latitude, max_longitude, max_latitude) are given only the areas intersecting them are loaded
+        self.bounds = bounds
+
+        # Checksum of the map (computed when first requested)
+        self.data_version = None
+
+        # If weight_by_area is True each matched area votes with the area of its intersection with the bounding box instead of 1
+        self.weight_by_area = weight_by_area
 
         self.risk_levels = ['Aree di Attenzione AA', 'Moderata P1', 'Media P2', 'Elevata P3', 'Molto elevata P4']
-        # Convert 'per_fr_ita' column to a categorical type with the defined order
-        self.map['per_fr_ita'] = self.map['per_fr_ita'].astype(pd.CategoricalDtype(categories=self.risk_levels, ordered=True))
+
+        # The map is kept in memory by the dataset manager, which may evict it and load it again when needed. Its key includes the
+        # signature of the files, so that a replaced map is not confused with the one in memory
+        self.dataset_manager = default_dataset_manager if dataset_manager is None else dataset_manager
+        self.dataset_key = (type(self).__name__, self.map_path, bounds, file_path_loader.get_signature(self.map_path))
+        self._get_dataset()
+
+
+    @property
+    def map(self) -> gpd.GeoDataFrame:
+        return self._get_dataset()[0]
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._get_dataset()[1]
+
+
+    def get_dataset_keys(self) -> list:
+        ''' Return the keys of the datasets of the getter in the dataset manager'''
+        return [self.dataset_key]
+
+    def _get_dataset(self) -> tuple[gpd.GeoDataFrame, np.ndarray]:
+        ''' Return the map and the risk level of each of its areas (encoded as EnvironmentalRisk values) from the dataset manager'''
+        return self.dataset_manager.acquire(self.dataset_key, self._load_dataset)
+
+    def _load_dataset(self) -> tuple[gpd.GeoDataFrame, np.ndarray]:
+        ''' Read the map and encode the risk level of each of its areas'''
+        import geopandas as gpd
+        import pandas as pd
+        from risk_getters.region_query import get_bounds_series
+
+        # Get the geodataframe
+        bbox = None if self.bounds is None else get_bounds_series(self.bounds)
+        map = gpd.read_file(self.map_path, bbox=bbox)
+
+        # Encode the 'per_fr_ita' column as EnvironmentalRisk values (P3 and P4 are both high), the last entry is used for the unknown categories (code -1)
+        category_risks = np.array([EnvironmentalRisk.VERY_LOW.value, EnvironmentalRisk.LOW.value, EnvironmentalRisk.MEDIUM.value,
+                                   EnvironmentalRisk.HIGH.value, EnvironmentalRisk.HIGH.value, EnvironmentalRisk.NO_DATA.value], dtype=np.uint8)
+        codes = category_risks[pd.Categorical(map['per_fr_ita'], categories=self.risk_levels).codes]
+
+        # Build the spatial index (aligned with the codes) now instead of at the first query
+        map.sindex
+
+        return map, codes
 
 
 
     def get_risk(self, longitude: float, latitude: float) -> EnvironmentalRisk:
         ''' Return the landslide risk by joining the map with a bounding box surrounding the geographic location given by (latitude, longitude) and using majority voting based on the number of matches'''
+        return self.get_risks([(longitude, latitude)])[0]
+
+
+    def get_risks(self, locations: list[tuple[float, float]]) -> list[EnvironmentalRisk]:
+        ''' Return the landslide risk of each (longitude, latitude) location by querying the spatial index with all the bounding boxes at once
+            and counting the votes of the matched areas of every box with a single bincount'''
+        import shapely
 
-        bounding_box_gdf = self._get_bounding_box_dataframe(longitude, latitude)
+        map, codes = self._get_dataset()
+        bounding_boxes = self._get_bounding_boxes(locations)
 
-        # Perform a spatial join with the map
-        result = gpd.sjoin(bounding_box_gdf, self.map, how="inner", predicate="intersects")
+        # Pairs (bounding box, area of the map) that intersect
+        box_index, map_index = map.sindex.query(bounding_boxes.values, predicate="intersects")
 
+        weights = None
+        if self.weight_by_area:
+            weights = shapely.area(shapely.intersection(bounding_boxes.values[box_index], map.geometry.values[map_index]))
 
-        # Majority vote
-        if result.empty:
-            return EnvironmentalRisk.NO_DATA
-        else:
-            votes_series = result["per_fr_ita"].value_counts()
-            votes = [votes_series[self.risk_levels[0]], votes_series[self.risk_levels[1]],
-                     votes_series[self.risk_levels[2]],
-                     votes_series[self.risk_levels[3]] + votes_series[self.risk_levels[4]]]
+        # Votes of each box for each risk level
+        n_levels = len(EnvironmentalRisk)
+        votes = np.bincount(box_index * n_levels + codes[map_index], weights=weights, minlength=len(locations) * n_levels).reshape(len(locations), n_levels)
 
-            index_max = argmax(votes)
-            if index_max == 0:
-                return EnvironmentalRisk.VERY_LOW
-            elif index_max == 1:
-                return EnvironmentalRisk.LOW
-            elif index_max == 2:
-                return EnvironmentalRisk.MEDIUM
-            else:
-                return EnvironmentalRisk.HIGH
+        # Majority vote (ties are resolved in favour of the lowest level), NO_DATA for the boxes without matches
+        matched = np.bincount(box_index, minlength=len(locations)) > 0
+        levels = np.where(matched, np.argmax(votes[:, 1:], axis=1) + 1, EnvironmentalRisk.NO_DATA.value)
 
+        return [EnvironmentalRisk(int(level)) for level in levels]
 
-    def _get_bounding_box_dataframe(self, longitude: float, latitude: float) -> gpd.GeoDataFrame:
-        '''Create a rectangular bounding box surrounding the geographic location given by (latitude, longitude) an return it as a geopandas geodataframe'''
-        bounding_box_coords = [(longitude - 0.01, latitude - 0.01),  # Bottom-left (Longitude, Latitude)
-                               (longitude + 0.01, latitude - 0.01),  # Bottom-right (Longitude, Latitude)
-                               (longitude + 0.01, latitude + 0.01),  # Top-right (Longitude, Latitude)
-                               (longitude - 0.01, latitude + 0.01)]  # Top-left (Longitude, Latitude)
 
-        # Create the polygon
-        bounding_box = Polygon(bounding_box_coords)
+    def get_data_version(self, longitude: float, latitude: float) -> str:
+        ''' Return the checksum of the map'''
+        return self._get_checksum()
 
-        # Create a GeoDataFrame for the bounding box
-        bounding_box_gdf = gpd.GeoDataFrame(geometry=[bounding_box], crs="EPSG:4326")
+    def _get_checksum(self) -> str:
+        ''' Return the checksum of the map, computed when first requested'''
+        if self.data_version is None:
+            self.data_version = self.file_path_loader.get_checksum(self.map_path)
+
+        return self.data_version
+
+    def is_data_current(self, version) -> bool:
+        ''' Return True if the risk has been computed with the current map'''
+        return version == self._get_checksum()
+
+
+    def _get_bounding_boxes(self, locations: list[tuple[float, float]]) -> gpd.GeoSeries:
+        '''Create the rectangular bounding boxes surrounding the geographic locations given by (longitude, latitude) and return them as a geopandas geoseries'''
+        import geopandas as gpd
+        import shapely
+
+        longitudes, latitudes = np.asarray(locations, dtype=float).reshape(-1, 2).T
+
+        bounding_boxes = gpd.GeoSeries(shapely.box(longitudes - 0.01, latitudes - 0.01, longitudes + 0.01, latitudes + 0.01), crs="EPSG:4326")
 
         # Adjust reference system
-        bounding_box_gdf = bounding_box_gdf.to_crs(self.map.crs)
+        return bounding_boxes.to_crs(self.map.crs)
 
-        return bounding_box_gdf
 
+    def get_encoded_layer(self) -> tuple[gpd.GeoSeries, np.ndarray]:
+        ''' Return the geometries of the map and the risk level of each geometry encoded as EnvironmentalRisk values'''
 
-    def plot(self, longitude: float, latitude: float):
-        ''' Plot the map and the location'''
+        map, codes = self._get_dataset()
+        return map.geometry, codes
+
+
+    def get_footprint_stats(self, footprints) -> list[dict]:
+        ''' Return the risk statistics of each footprint (shapely polygons, lines or points in EPSG:4326): the fraction of its area (length for the lines)
+            covered by each risk level (overlapping areas are counted once each), and the risk level covering the largest part'''
+        import geopandas as gpd
+        from risk_getters.footprints import get_footprint_stats_from_weights, get_vector_footprint_weights
 
-        # Create the point associated to the location
-        point = Point(longitude, latitude)
-        point_gdf = gpd.GeoDataFrame(index=[0], crs="EPSG:4326", geometry=[point])
+        map, codes = self._get_dataset()
+        weights, totals = get_vector_footprint_weights(map.geometry, codes, gpd.GeoSeries(list(footprints), crs="EPSG:4326"))
 
-        # Adjust the reference system
-        point_gdf = point_gdf.to_crs(self.map.crs)
+        return get_footprint_stats_from_weights(weights, totals)
 
-        # Plot the map
-        ax = self.map.plot(color='lightblue', cmap='OrRd', legend=True, figsize=(10, 10))
 
-        # Plot the point
-        point_gdf.plot(ax=ax, color='blue', markersize=10)
-        plt.title("Shapefile and Point Location")
-        plt.show()
+    def iter_areas(self, area, min_risk: EnvironmentalRisk, chunk_size: int = 1000) -> Iterator[dict]:
+        ''' Yield the GeoJSON features of the areas of the map, clipped to area (a bounding box (min_longitude, min_latitude, max_longitude, max_latitude)
+            or a shapely geometry), whose risk is at least min_risk, querying the spatial index of the map'''
+        from risk_getters.region_query import iter_vector_features
+
+        map, codes = self._get_dataset()
+        yield from iter_vector_features(map.geometry, codes, area, min_risk, EnvironmentalRiskType.LANDSLIDE_RISK, chunk_size)
+
+
+    def plot(self, longitude: float, latitude: float):
+        ''' Plot the map and the location'''
+        from risk_getters.visualization import plot_landslide_map
+
+        plot_landslide_map(self, longitude, latitude)
 
 
 class LandslideRiskThAPI(LandslideRiskGetter):
@@ -108,4 +189,13 @@ class LandslideRiskThAPI(LandslideRiskGetter):
         return self.api.get_risk_level(longitude, latitude, self.RISK_TYPE)
 
 
+    def get_data_version(self, longitude: float, latitude: float):
+        ''' Return the version (ADM2 code and ETag or content hash) of the ThinkHazard report of the location'''
+        return self.api.get_report_version(longitude, latitude)
+
+    def is_data_current(self, version) -> bool:
+        ''' Return True if the ThinkHazard report has not changed since version'''
+        return self.api.is_report_current(version)
+
+
 
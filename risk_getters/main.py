@@ -7,31 +7,15 @@ from risk_getters.flood_risk_getters import FloodRiskMap, RiverFloodRiskThAPI, U
 from constants import *
 from api_interfaces.thinkhazard_API import ThinkHazardAPI
 from risk_getters.enumerations import EnvironmentalRiskType, EnvironmentalRisk
+from risk_getters.incremental import IncrementalEvaluator, ResultStore
+from risk_getters.risk_results import RiskResults, RISK_LABELS, RISK_SCORES
 import json
 
 def map_risk_level(risk: EnvironmentalRisk):
-    if risk == EnvironmentalRisk.LOW or risk == EnvironmentalRisk.NO_DATA or risk == EnvironmentalRisk.VERY_LOW:
-        return "low"
-    elif risk == EnvironmentalRisk.MEDIUM:
-        return "medium"
-    elif risk == EnvironmentalRisk.HIGH:
-        return "high"
-    else:
-        raise ValueError(f"Invalid risk level: {risk}")
+    return str(RISK_LABELS[risk.value])
 
 def map_risk_level_2(risk: EnvironmentalRisk):
-    if risk == EnvironmentalRisk.NO_DATA:
-        return 0
-    elif risk == EnvironmentalRisk.VERY_LOW:
-        return 1
-    elif risk == EnvironmentalRisk.LOW:
-        return 2
-    elif risk == EnvironmentalRisk.MEDIUM:
-        return 3
-    elif risk == EnvironmentalRisk.HIGH:
-        return 4
-    else:
-        raise ValueError(f"Invalid risk level: {risk}")
+    return int(RISK_SCORES[risk.value])
 
 def main():
     thAPI = ThinkHazardAPI()
@@ -145,9 +129,9 @@ def extract_cities_data_2():
     with open("cities_data.json", "r") as f:
         cities_data = json.load(f)
 
-    cities_data_generated = []
+    indicators = []
+    carbon_intensities = []
     for city_data in cities_data:
-        city_name = city_data["name"]
         lat = city_data["lat"]
         lon = city_data["lon"]
 
@@ -161,20 +145,64 @@ def extract_cities_data_2():
         carbon_intensity = get_carbon_intensity(lon, lat)
         print(f"Carbon Intensity: {carbon_intensity} gCO2eq/kWh")
 
+        indicators.append(risk_indicators)
+        carbon_intensities.append(carbon_intensity)
+
+    with open('cities_data2.json', 'w') as json_file:
+        json.dump(get_cities_scores(cities_data, RiskResults.from_indicators(indicators), carbon_intensities), json_file, indent=4)
+
+
+def get_cities_scores(cities_data: list[dict], results: RiskResults, carbon_intensities: list) -> list[dict]:
+    ''' Return the data of each city with the 0-4 scores of its risk levels, mapped column by column'''
+    flood_hazard = results.to_scores(EnvironmentalRiskType.FLOOD_RIVER_RISK).tolist()
+    landslide_hazard = results.to_scores(EnvironmentalRiskType.LANDSLIDE_RISK).tolist()
+    climatic_hazard = results.to_scores(EnvironmentalRiskType.FLOOD_URBAN_RISK).tolist()
+    seismic_hazard = results.to_scores(EnvironmentalRiskType.SEISMIC_RISK).tolist()
+
+    cities_data_generated = []
+    for i, city_data in enumerate(cities_data):
         city = {
-            "name" : city_name,
-            "lat" : lat,
-            "lon" : lon,
-            "flood_hazard" : map_risk_level_2(risk_indicators[EnvironmentalRiskType.FLOOD_RIVER_RISK]),
-            "landslide_hazard" : map_risk_level_2(risk_indicators[EnvironmentalRiskType.LANDSLIDE_RISK]),
-            "climatic_hazard" : map_risk_level_2(risk_indicators[EnvironmentalRiskType.FLOOD_URBAN_RISK]),
-            "seismic_hazard" : map_risk_level_2(risk_indicators[EnvironmentalRiskType.SEISMIC_RISK]),
-            "carbon_intensity_gCO2eq_kWh" : carbon_intensity
+            "name" : city_data["name"],
+            "lat" : city_data["lat"],
+            "lon" : city_data["lon"],
+            "flood_hazard" : flood_hazard[i],
+            "landslide_hazard" : landslide_hazard[i],
+            "climatic_hazard" : climatic_hazard[i],
+            "seismic_hazard" : seismic_hazard[i],
+            "carbon_intensity_gCO2eq_kWh" : carbon_intensities[i]
         }
         cities_data_generated.append(city)
 
+    return cities_data_generated
+
+
+def extract_cities_data_incremental():
+    ''' Same as extract_cities_data_2 but only the risk types and carbon intensities whose inputs changed since the last run are evaluated again'''
+    thAPI = ThinkHazardAPI()
+    ufl1 = UrbanFloodRiskThAPI(thAPI)
+    rfl1 = RiverFloodRiskThAPI(thAPI)
+    land1 = LandslideRiskThAPI(thAPI)
+    seis1 = SeismicRiskThAPI(thAPI)
+
+    risk_getters_per_type = { EnvironmentalRiskType.SEISMIC_RISK : [seis1],
+                              EnvironmentalRiskType.LANDSLIDE_RISK : [land1],
+                              EnvironmentalRiskType.FLOOD_RIVER_RISK : [rfl1],
+                              EnvironmentalRiskType.FLOOD_URBAN_RISK : [ufl1]}
+
+    risk_manager = RiskManager(risk_getters_per_type)
+    evaluator = IncrementalEvaluator(risk_manager, ResultStore("cities_data_store.json"))
+
+    with open("cities_data.json", "r") as f:
+        cities_data = json.load(f)
+
+    results = evaluator.evaluate_batch([(city_data["lon"], city_data["lat"]) for city_data in cities_data])
+    print(f"Reused: {evaluator.stats['reused']}, Recomputed: {evaluator.stats['recomputed']}")
+
+    indicators = [risk_indicators for risk_indicators, _ in results]
+    carbon_intensities = [carbon_intensity for _, carbon_intensity in results]
+
     with open('cities_data2.json', 'w') as json_file:
-        json.dump(cities_data_generated, json_file, indent=4)
+        json.dump(get_cities_scores(cities_data, RiskResults.from_indicators(indicators), carbon_intensities), json_file, indent=4)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+
+class SlowQueryProfiler:
+    ''' Opt-in profiler of the slow queries (e.g. of RiskManager.get_indicators). Only the queries taking more than threshold seconds are traced, and
+        each trace is written in output_dir together with its tags (coordinates, getters consulted, ...), keeping only the last max_traces traces
+        (the ones found in output_dir when the profiler is created and the ones it writes, other processes writing in the same directory keep their own).
+        In "sample" mode a background thread samples every sample_interval seconds the stack of the queries running for more than threshold seconds
+        (the fast queries are never sampled, and the thread sleeps while no query is slow) and the trace is written in the collapsed stack format
+        of the flamegraph tools (.folded).
+        In "cprofile" mode every query runs under cProfile (one at a time, with its overhead) and the trace is written as a pstats file (.prof)'''
+
+    SAMPLE = "sample"
+    CPROFILE = "cprofile"
+
+    def __init__(self, output_dir: str, threshold: float = 1.0, batch_threshold: float = None, mode: str = SAMPLE,
+                 sample_interval: float = 0.005, max_traces: int = 100):
+        if mode not in (self.SAMPLE, self.CPROFILE):
+            raise ValueError(f"Invalid profiling mode: {mode}")
+
+        self.output_dir = output_dir
+        self.threshold = threshold
+        self.batch_threshold = batch_threshold
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.max_traces = max_traces
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Queries in progress in sample mode. Keys = query id values = (thread id, start time, threshold, collapsed stacks counter)
+        self.active = {}
+        self.lock = threading.Lock()
+        self.sampler = None
+        self.query_ids = itertools.count()
+
+        # Set when a query starts, to wake up the sampler thread waiting for a query to become slow
+        self.wakeup = threading.Event()
+
+        # Traces in output_dir (paths without extension), from the oldest
+        self.traces_lock = threading.Lock()
+        tag_files = sorted((entry for entry in os.scandir(output_dir) if entry.name.endswith(".json")), key=lambda entry: entry.stat().st_mtime_ns)
+        self.traces = deque(os.path.splitext(entry.path)[0] for entry in tag_files)
+
+        # In cprofile mode a single query is profiled at a time
+        self.cprofile_lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, tags: dict, threshold: float = None):
+        ''' Profile the block and write its trace, with tags, if it takes more than threshold seconds (the threshold of the profiler if None).
+            The tags dictionary is yielded so that the block can add to it'''
+        threshold = self.threshold if threshold is None else threshold
+
+        if self.mode == self.CPROFILE:
+            with self._profile_cprofile(tags, threshold):
+                yield tags
+        else:
+            with self._profile_sample(tags, threshold):
+                yield tags
+
+    @contextmanager
+    def _profile_sample(self, tags: dict, threshold: float):
+        query_id = next(self.query_ids)
+        samples = Counter()
+        start = time.perf_counter()
+
+        with self.lock:
+            self.active[query_id] = (threading.get_ident(), start, threshold, samples)
+            if not self.wakeup.is_set():
+                self.wakeup.set()
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, daemon=True)
+                self.sampler.start()
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                del self.active[query_id]
+                samples = samples.copy()
+
+            if elapsed > threshold:
+                lines = "".join(f"{stack} {count}\n" for stack, count in samples.items())
+                self._write_trace(tags, elapsed, threshold, ".folded", lambda path: self._write_text(path, lines))
+
+    @contextmanager
+    def _profile_cprofile(self, tags: dict, threshold: float):
+        import cProfile
+
+        # The queries running while another one is profiled (including the nested ones) are not profiled
+        if not self.cprofile_lock.acquire(blocking=False):
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+        finally:
+            self.cprofile_lock.release()
+
+            elapsed = time.perf_counter() - start
+            if elapsed > threshold:
+                self._write_trace(tags, elapsed, threshold, ".prof", profiler.dump_stats)
+
+    def _sample(self):
+        ''' Sample the stacks of the queries running for more than their threshold (run by the sampler thread). Between the samples the thread
+            waits until the first query in progress becomes slow, or until a query starts if there are none'''
+        while True:
+            with self.lock:
+                self.wakeup.clear()
+                now = time.perf_counter()
+                slow = [(query_id, thread_id) for query_id, (thread_id, start, threshold, _) in self.active.items() if now - start > threshold]
+
+                if slow:
+                    timeout = self.sample_interval
+                elif self.active:
+                    timeout = min(start + threshold for _, start, threshold, _ in self.active.values()) - now
+                else:
+                    timeout = None
+
+            if slow:
+                frames = sys._current_frames()
+                stacks = [(query_id, self._get_collapsed_stack(frames[thread_id])) for query_id, thread_id in slow if thread_id in frames]
+                del frames
+
+                # The counters are only updated while their queries are in progress
+                with self.lock:
+                    for query_id, stack in stacks:
+                        if query_id in self.active:
+                            self.active[query_id][3][stack] += 1
+
+            self.wakeup.wait(timeout)
+
+    def _get_collapsed_stack(self, frame) -> str:
+        ''' Return the stack of frame, from the outermost call, in the collapsed stack format (frames separated by semicolons)'''
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+
+        return ";".join(reversed(stack))
+
+    def _write_trace(self, tags: dict, elapsed: float, threshold: float, extension: str, write):
+        ''' Write a trace (with write(path)) and its tags in the output directory and remove the oldest traces beyond max_traces'''
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}_{next(self.query_ids)}_{int(elapsed * 1000)}ms"
+        trace_path = os.path.join(self.output_dir, name + extension)
+        write(trace_path)
+
+        tags = dict(tags, elapsed=elapsed, threshold=threshold, mode=self.mode, trace=os.path.basename(trace_path))
+        self._write_text(os.path.join(self.output_dir, name + ".json"), json.dumps(tags, default=str, indent=4))
+
+        self._rotate(os.path.join(self.output_dir, name))
+
+    def _write_text(self, file_path: str, text: str):
+        with open(file_path, 'w') as file:
+            file.write(text)
+
+    def _rotate(self, root: str):
+        ''' Record the trace just written (its path without extension) and remove the oldest traces (and their tags) beyond max_traces'''
+        with self.traces_lock:
+            self.traces.append(root)
+            removed = [self.traces.popleft() for _ in range(max(len(self.traces) - self.max_traces, 0))]
+
+        for root in removed:
+            for extension in (".json", ".folded", ".prof"):
+                if os.path.exists(root + extension):
+                    os.remove(root + extension)
@@ -0,0 +1,110 @@
+import json
+from typing import Iterable, Iterator
+import numpy as np
+from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
+from risk_getters.riskInterfaces import RiskGetter
+
+
+def get_area(area):
+    ''' Return the area of a query (a bounding box (min_longitude, min_latitude, max_longitude, max_latitude) or a shapely geometry in EPSG:4326) as a shapely geometry'''
+    from shapely.geometry import box
+
+    if isinstance(area, (tuple, list)):
+        min_longitude, min_latitude, max_longitude, max_latitude = area
+
+        # Keep the area projectable (e.g. to Web Mercator) and densify its edges so that they follow the projection
+        return box(max(min_longitude, -180), max(min_latitude, -89.9), min(max_longitude, 180), min(max_latitude, 89.9)).segmentize(1.0)
+    return area
+
+
+def get_bounds_series(bounds: tuple):
+    ''' Return the area given by bounds (min_longitude, min_latitude, max_longitude, max_latitude) as a geopandas geoseries used to filter a map while reading it'''
+    import geopandas as gpd
+
+    return gpd.GeoSeries([get_area(bounds)], crs="EPSG:4326")
+
+
+def make_feature(geometry: dict, risk_type: EnvironmentalRiskType, risk: EnvironmentalRisk) -> dict:
+    ''' Return a GeoJSON feature of an area with the given risk'''
+    return {"type": "Feature", "geometry": geometry, "properties": {"risk_type": risk_type.value, "risk": risk.name}}
+
+
+def iter_vector_features(geometries, codes: np.ndarray, area, min_risk: EnvironmentalRisk, risk_type: EnvironmentalRiskType, chunk_size: int = 1000) -> Iterator[dict]:
+    ''' Yield the GeoJSON features (in EPSG:4326, clipped to the area) of the geometries (an indexed geopandas GeoSeries) whose risk
+        code is at least min_risk, querying the spatial index with the area and converting the matches chunk_size at a time'''
+    import geopandas as gpd
+    import shapely
+    from shapely.geometry import mapping
+
+    area_in_crs = gpd.GeoSeries([get_area(area)], crs="EPSG:4326").to_crs(geometries.crs).iloc[0]
+
+    hits = geometries.sindex.query(area_in_crs, predicate="intersects")
+    hits = hits[codes[hits] >= max(min_risk.value, EnvironmentalRisk.VERY_LOW.value)]
+
+    for start in range(0, len(hits), chunk_size):
+        chunk = hits[start:start + chunk_size]
+        clipped = gpd.GeoSeries(shapely.intersection(geometries.values[chunk], area_in_crs), crs=geometries.crs).to_crs("EPSG:4326")
+
+        for geometry, code in zip(clipped.values, codes[chunk]):
+            if not geometry.is_empty:
+                yield make_feature(mapping(geometry), risk_type, EnvironmentalRisk(int(code)))
+
+
+def iter_hazard_features(risk_getters_per_type: dict[EnvironmentalRiskType, list[RiskGetter]], area, min_risk: EnvironmentalRisk) -> Iterator[dict]:
+    ''' Yield the GeoJSON features of all the areas, within the query area, whose risk is at least min_risk according to the
+        map getters (the getters providing iter_areas, e.g. SeismicRiskMap, FloodRiskMap and LandslideRiskMap)'''
+    for risk_type, getters in risk_getters_per_type.items():
+        for getter in getters:
+            if hasattr(getter, "iter_areas"):
+                for feature in getter.iter_areas(area, min_risk):
+                    feature["properties"]["risk_type"] = risk_type.value
+                    yield feature
+
+
+def write_geojson(features: Iterable[dict], file_path: str) -> int:
+    ''' Write the features as a GeoJSON FeatureCollection one at a time and return how many have been written'''
+    count = 0
+    with open(file_path, 'w') as json_file:
+        json_file.write('{"type": "FeatureCollection", "features": [\n')
+        for feature in features:
+            json_file.write((",\n" if count else "") + json.dumps(feature))
+            count += 1
+        json_file.write('\n]}\n')
+
+    return count
+
+
+def write_geoparquet(features: Iterable[dict], file_path: str, batch_size: int = 10000) -> int:
+    ''' Write the features as a GeoParquet file (WKB geometries in EPSG:4326) batch_size at a time and return how many have been written'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import shapely
+    from shapely.geometry import shape
+
+    schema = pa.schema([("geometry", pa.binary()), ("risk_type", pa.string()), ("risk", pa.string())],
+                       metadata={"geo": json.dumps({"version": "1.0.0", "primary_column": "geometry",
+                                                    "columns": {"geometry": {"encoding": "WKB", "geometry_types": []}}})})
+
+    count = 0
+    with pq.ParquetWriter(file_path, schema) as writer:
+        batch = []
+        for feature in features:
+            batch.append(feature)
+            if len(batch) == batch_size:
+                count += _write_geoparquet_batch(writer, schema, batch, shapely, shape)
+                batch = []
+        if batch:
+            count += _write_geoparquet_batch(writer, schema, batch, shapely, shape)
+
+    return count
+
+
+def _write_geoparquet_batch(writer, schema, features: list[dict], shapely, shape) -> int:
+    import pyarrow as pa
+
+    table = pa.table({"geometry": shapely.to_wkb([shape(feature["geometry"]) for feature in features]),
+                      "risk_type": [feature["properties"]["risk_type"] for feature in features],
+                      "risk": [feature["properties"]["risk"] for feature in features]}, schema=schema)
+    writer.write_table(table)
+
+    return len(features)
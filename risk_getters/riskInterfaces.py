@@ -1,5 +1,9 @@
 from abc import ABC, abstractmethod
-from enumerations import EnvironmentalRiskType, EnvironmentalRisk
+import numpy as np
+from risk_getters.enumerations import EnvironmentalRiskType, EnvironmentalRisk
+from risk_getters.footprints import make_footprint_stats
+from risk_getters.profiling import SlowQueryProfiler
+from risk_getters.risk_results import RiskResults
 
 class RiskGetter(ABC):
 
@@ -8,28 +12,71 @@ class RiskGetter(ABC):
         ''' Return the environmental risk associated to the given longitude and latitude.'''
         pass
 
+    def get_data_version(self, longitude: float, latitude: float):
+        ''' Return the version of the data used to compute the risk of the given longitude and latitude (None if the getter does not track it).'''
+        return None
+
+    def is_data_current(self, version) -> bool:
+        ''' Return True if a risk computed with the data at the given version is still valid.'''
+        return False
+
+    def get_footprint_stats(self, footprints) -> list[dict]:
+        ''' Return the risk statistics (see make_footprint_stats) of each footprint (shapely polygons, lines or points in EPSG:4326).
+            By default the footprint gets the risk of its representative point, the map getters override it with area-weighted statistics.'''
+        stats = []
+        for footprint in footprints:
+            point = footprint.representative_point()
+            risk = self.get_risk(point.x, point.y)
+            stats.append(make_footprint_stats(risk, {risk: 1.0}))
+
+        return stats
+
+
+def get_majority_risk(codes: np.ndarray, weights: np.ndarray = None) -> EnvironmentalRisk:
+    ''' Return the risk level voted by the majority of the matched features, whose risk levels are given as EnvironmentalRisk values in codes.
+        Ties are resolved in favour of the lowest level'''
+    if len(codes) == 0:
+        return EnvironmentalRisk.NO_DATA
+
+    votes = np.bincount(codes, weights=weights, minlength=len(EnvironmentalRisk))
+    return EnvironmentalRisk(int(np.argmax(votes[1:])) + 1)
+
 
 
 class RiskManager:
     ''' The Risk Manager deals with the different risk getters and return the risk indicators for each risk type'''
-    def __init__(self, risk_getters_per_type: dict[EnvironmentalRiskType, list[RiskGetter]]):
+    def __init__(self, risk_getters_per_type: dict[EnvironmentalRiskType, list[RiskGetter]], profiler: SlowQueryProfiler = None):
 
         # For each risk type there is a list of list getters
         self.risk_getters_per_type = risk_getters_per_type
 
+        # If a profiler is given the slow queries are traced, tagged with their coordinates and the getters consulted
+        self.profiler = profiler
+
     def get_indicators(self, longitude: float, latitude: float) -> dict[EnvironmentalRiskType, EnvironmentalRisk]:
         ''' Return the risk indicators, for each risk type, associated to the location with the given longitude and latitude.
             The RiskManager will try to take the risk indicator (level) for each risk type until the list ends. In these way the
             the manager can deal with getters that do not provide risk data for that particular location
         '''
 
+        if self.profiler is not None:
+            with self.profiler.profile({"longitude": longitude, "latitude": latitude}) as tags:
+                return self._get_indicators(longitude, latitude, tags)
+
+        return self._get_indicators(longitude, latitude)
+
+    def _get_indicators(self, longitude: float, latitude: float, tags: dict = None) -> dict[EnvironmentalRiskType, EnvironmentalRisk]:
+        ''' Return the risk indicators of the location, adding to tags (if given) the getters consulted for each risk type'''
+
         # Fetch the risk indicator for each risk type until one getter has data associated to it
         result = {}
         for risk_type in self.risk_getters_per_type.keys():
 
+            consulted = []
             for getter in self.risk_getters_per_type[risk_type]:
 
                 risk_indicator = getter.get_risk(longitude, latitude)
+                consulted.append(type(getter).__name__)
 
                 if risk_indicator != EnvironmentalRisk.NO_DATA:
                     result[risk_type] = risk_indicator
@@ -38,5 +85,44 @@ class RiskManager:
             if not risk_type in result.keys():
                 result[risk_type] = EnvironmentalRisk.NO_DATA
 
+            if tags is not None:
+                tags.setdefault("getters", {})[risk_type.name] = consulted
+
         return result
 
+    def get_indicators_batch(self, locations: list[tuple[float, float]]) -> list[dict[EnvironmentalRiskType, EnvironmentalRisk]]:
+        ''' Return the risk indicators for each (longitude, latitude) location of the batch, in input order'''
+        if self.profiler is not None and self.profiler.batch_threshold is not None:
+            locations = list(locations)
+            with self.profiler.profile({"batch_size": len(locations), "first_location": locations[0] if locations else None}, self.profiler.batch_threshold):
+                return [self.get_indicators(longitude, latitude) for longitude, latitude in locations]
+
+        return [self.get_indicators(longitude, latitude) for longitude, latitude in locations]
+
+    def get_results_batch(self, locations: list[tuple[float, float]]) -> RiskResults:
+        ''' Return the risk indicators of the (longitude, latitude) locations of the batch, in input order, as columns of a RiskResults'''
+        return RiskResults.from_indicators(self.get_indicators_batch(locations), list(self.risk_getters_per_type.keys()))
+
+    def get_footprint_indicators(self, footprints) -> list[dict[EnvironmentalRiskType, dict]]:
+        ''' Return the risk statistics (see make_footprint_stats), for each risk type, of each footprint (shapely polygons, lines or points in EPSG:4326).
+            As for get_indicators, the footprints without data are passed to the next getter of the risk type, each getter receiving them in a single batch'''
+        footprints = list(footprints)
+        result = [{} for _ in footprints]
+
+        for risk_type, getters in self.risk_getters_per_type.items():
+            pending = list(range(len(footprints)))
+            for i in pending:
+                result[i][risk_type] = make_footprint_stats(EnvironmentalRisk.NO_DATA, {})
+
+            for getter in getters:
+                if not pending:
+                    break
+
+                no_data = []
+                for i, stats in zip(pending, getter.get_footprint_stats([footprints[i] for i in pending])):
+                    result[i][risk_type] = stats
+                    if stats["risk"] == EnvironmentalRisk.NO_DATA:
+                        no_data.append(i)
+                pending = no_data
+
+        return result
@@ -0,0 +1,190 @@
+import json
+import os
+import math
+from collections import Counter
+from typing import Callable
+import numpy as np
+from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
+from risk_getters.risk_results import RiskResults
+
+# The 4 risk levels of a location are packed in a 16 bits code, 3 bits per risk type in this order
+RISK_TYPES = list(EnvironmentalRiskType)
+BITS_PER_RISK_TYPE = 3
+
+# Set on the cells whose samples do not agree even at the maximum depth
+HETEROGENEOUS_FLAG = 1 << 15
+
+# Value of the children index of the cells that are not subdivided
+NO_CHILDREN = -1
+
+
+def pack_indicators(indicators: dict[EnvironmentalRiskType, EnvironmentalRisk]) -> int:
+    ''' Return the code packing the risk indicators of a location (the missing risk types are packed as NO_DATA)'''
+    code = 0
+    for i, risk_type in enumerate(RISK_TYPES):
+        code |= indicators.get(risk_type, EnvironmentalRisk.NO_DATA).value << (i * BITS_PER_RISK_TYPE)
+    return code
+
+
+def unpack_indicators(code: int) -> dict[EnvironmentalRiskType, EnvironmentalRisk]:
+    ''' Return the risk indicators packed in code'''
+    mask = (1 << BITS_PER_RISK_TYPE) - 1
+    return {risk_type: EnvironmentalRisk((int(code) >> (i * BITS_PER_RISK_TYPE)) & mask) for i, risk_type in enumerate(RISK_TYPES)}
+
+
+
+def build_risk_grid(file_path: str, evaluate_batch: Callable, bounds: tuple, base_resolution: float, max_depth: int = 4, samples_per_side: int = 4) -> "RiskGrid":
+    ''' Precompute the risk indicators over the region given by bounds (min_longitude, min_latitude, max_longitude, max_latitude) and save them in file_path.
+        The region is divided in cells of base_resolution degrees, each cell is evaluated (with evaluate_batch, e.g. RiskManager.get_indicators_batch)
+        on a regular lattice of samples_per_side x samples_per_side points and, if they do not agree, it is divided in 4 children up to max_depth levels (quadtree).
+        The cells still heterogeneous at the maximum depth are flagged, so that they can be refined online'''
+    min_longitude, min_latitude, max_longitude, max_latitude = bounds
+    n_cols = max(math.ceil((max_longitude - min_longitude) / base_resolution), 0)
+    n_rows = max(math.ceil((max_latitude - min_latitude) / base_resolution), 0)
+
+    # Cells to evaluate as (node index, min_longitude, min_latitude, size), starting from the base grid
+    level = [(row * n_cols + col, min_longitude + col * base_resolution, min_latitude + row * base_resolution, base_resolution)
+             for row in range(n_rows) for col in range(n_cols)]
+    cells = [0] * len(level)
+    children = [NO_CHILDREN] * len(level)
+
+    for depth in range(max_depth + 1):
+        if not level:
+            break
+
+        # Evaluate the samples of all the cells of the level in a single batch
+        locations = [(x + (i + 0.5) * size / samples_per_side, y + (j + 0.5) * size / samples_per_side)
+                     for _, x, y, size in level for j in range(samples_per_side) for i in range(samples_per_side)]
+        codes = [pack_indicators(indicators) for indicators in evaluate_batch(locations)]
+
+        n_samples = samples_per_side * samples_per_side
+        next_level = []
+        for i, (node, x, y, size) in enumerate(level):
+            samples = codes[n_samples * i:n_samples * (i + 1)]
+            cells[node] = Counter(samples).most_common(1)[0][0]
+
+            if len(set(samples)) > 1:
+                if depth == max_depth:
+                    cells[node] |= HETEROGENEOUS_FLAG
+                else:
+                    # Children are stored in blocks of 4, quadrant index = 2 * upper half + right half
+                    children[node] = len(cells)
+                    for dy in (0, 1):
+                        for dx in (0, 1):
+                            next_level.append((len(cells), x + dx * size / 2, y + dy * size / 2, size / 2))
+                            cells.append(0)
+                            children.append(NO_CHILDREN)
+
+        level = next_level
+
+    np.asarray(cells, dtype=np.uint16).tofile(file_path + ".cells")
+    np.asarray(children, dtype=np.int32).tofile(file_path + ".children")
+    with open(file_path + ".json", 'w') as json_file:
+        json.dump({"bounds": list(bounds), "base_resolution": base_resolution, "n_cols": n_cols, "n_rows": n_rows,
+                   "max_depth": max_depth, "risk_types": [risk_type.name for risk_type in RISK_TYPES]}, json_file)
+
+    return RiskGrid(file_path)
+
+
+
+class RiskGrid:
+    ''' Precomputed risk indicators (built by build_risk_grid) read from memory-mapped files. The locations falling in cells flagged as
+        heterogeneous or outside the region are evaluated with fallback_batch (e.g. RiskManager.get_indicators_batch) if it is given'''
+
+    def __init__(self, file_path: str, fallback_batch: Callable = None):
+        with open(file_path + ".json", 'r') as json_file:
+            self.header = json.load(json_file)
+
+        if self.header["risk_types"] != [risk_type.name for risk_type in RISK_TYPES]:
+            raise ValueError(f"The grid {file_path} has been built with different risk types")
+
+        # An empty file (grid of an empty region) cannot be memory-mapped
+        self.cells = self._map_file(file_path + ".cells", np.uint16)
+        self.children = self._map_file(file_path + ".children", np.int32)
+        self.fallback_batch = fallback_batch
+
+    def _map_file(self, file_path: str, dtype) -> np.ndarray:
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=dtype)
+
+        return np.memmap(file_path, dtype=dtype, mode='r')
+
+    def get_inside(self, longitudes, latitudes) -> np.ndarray:
+        ''' Return True for the locations given by (longitudes, latitudes) inside the region of the grid'''
+        min_longitude, min_latitude, _, _ = self.header["bounds"]
+        resolution = self.header["base_resolution"]
+
+        cols = np.floor((np.atleast_1d(np.asarray(longitudes, dtype=float)) - min_longitude) / resolution)
+        rows = np.floor((np.atleast_1d(np.asarray(latitudes, dtype=float)) - min_latitude) / resolution)
+
+        return (cols >= 0) & (cols < self.header["n_cols"]) & (rows >= 0) & (rows < self.header["n_rows"])
+
+    def get_codes(self, longitudes, latitudes) -> np.ndarray:
+        ''' Return the packed codes of the locations given by (longitudes, latitudes), 0 (all NO_DATA) outside the region'''
+        min_longitude, min_latitude, _, _ = self.header["bounds"]
+        resolution = self.header["base_resolution"]
+        n_cols, n_rows = self.header["n_cols"], self.header["n_rows"]
+
+        x = (np.atleast_1d(np.asarray(longitudes, dtype=float)) - min_longitude) / resolution
+        y = (np.atleast_1d(np.asarray(latitudes, dtype=float)) - min_latitude) / resolution
+        cols, rows = np.floor(x), np.floor(y)
+        inside = (cols >= 0) & (cols < n_cols) & (rows >= 0) & (rows < n_rows)
+        if not inside.any():
+            return np.zeros(len(inside), dtype=np.uint16)
+
+        # Position within the current cell in [0, 1)
+        x, y = x - cols, y - rows
+        nodes = np.where(inside, rows * n_cols + cols, 0).astype(np.int64)
+
+        # Descend the quadtree of all the locations together
+        for _ in range(self.header["max_depth"]):
+            child = self.children[nodes]
+            subdivided = inside & (child != NO_CHILDREN)
+            if not subdivided.any():
+                break
+
+            right, upper = x >= 0.5, y >= 0.5
+            nodes = np.where(subdivided, child + 2 * upper + right, nodes)
+            x = np.where(subdivided, 2 * x - right, x)
+            y = np.where(subdivided, 2 * y - upper, y)
+
+        return np.where(inside, self.cells[nodes], 0).astype(np.uint16)
+
+    def get_indicators(self, longitude: float, latitude: float) -> dict[EnvironmentalRiskType, EnvironmentalRisk]:
+        ''' Return the risk indicators of the location given by (longitude, latitude)'''
+        return self.get_indicators_batch([(longitude, latitude)])[0]
+
+    def get_indicators_batch(self, locations: list[tuple[float, float]]) -> list[dict[EnvironmentalRiskType, EnvironmentalRisk]]:
+        ''' Return the risk indicators for each (longitude, latitude) location of the batch, in input order'''
+        locations = list(locations)
+        if not locations:
+            return []
+
+        longitudes, latitudes = np.asarray(locations, dtype=float).T
+        codes = self.get_codes(longitudes, latitudes)
+        result = [unpack_indicators(int(code) & ~HETEROGENEOUS_FLAG) for code in codes]
+
+        # Refine the locations in heterogeneous cells and evaluate those outside the region
+        if self.fallback_batch is not None:
+            refine = np.nonzero((codes & HETEROGENEOUS_FLAG).astype(bool) | ~self.get_inside(longitudes, latitudes))[0]
+            if len(refine) > 0:
+                for i, indicators in zip(refine, self.fallback_batch([locations[i] for i in refine])):
+                    result[i] = indicators
+
+        return result
+
+    def get_results_batch(self, locations: list[tuple[float, float]]) -> RiskResults:
+        ''' Same as get_indicators_batch but the indicators are unpacked all at once in the columns of a RiskResults'''
+        locations = list(locations)
+        longitudes, latitudes = np.asarray(locations, dtype=float).reshape(-1, 2).T
+        codes = self.get_codes(longitudes, latitudes)
+        results = RiskResults.from_packed_codes(codes)
+
+        # Refine the locations in heterogeneous cells and evaluate those outside the region
+        if self.fallback_batch is not None:
+            refine = np.nonzero((codes & HETEROGENEOUS_FLAG).astype(bool) | ~self.get_inside(longitudes, latitudes))[0]
+            if len(refine) > 0:
+                refined = RiskResults.from_indicators(self.fallback_batch([locations[i] for i in refine]), RISK_TYPES)
+                results.codes[:, refine] = refined.codes
+
+        return results
@@ -0,0 +1,97 @@
+import numpy as np
+from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
+
+# Lookup tables indexed by the EnvironmentalRisk values (NO_DATA, VERY_LOW, LOW, MEDIUM, HIGH)
+RISK_LABELS = np.array(["low", "low", "low", "medium", "high"])
+RISK_SCORES = np.array([0, 1, 2, 3, 4], dtype=np.uint8)
+
+# Names of the risk levels indexed by their EnvironmentalRisk value, used as dictionary of the categorical exports
+RISK_NAMES = [EnvironmentalRisk(value).name for value in range(len(EnvironmentalRisk))]
+
+
+class RiskResults:
+    ''' Risk indicators of many locations stored as one uint8 array (of EnvironmentalRisk values) per risk type, all the columns
+        being rows of a single 2D array. The exports to NumPy, pandas and Arrow share the arrays instead of copying them'''
+
+    def __init__(self, risk_types: list[EnvironmentalRiskType], codes: np.ndarray):
+        codes = np.asarray(codes, dtype=np.uint8)
+        if codes.ndim != 2 or codes.shape[0] != len(risk_types):
+            raise ValueError(f"Expected a ({len(risk_types)}, n) array of codes, got shape {codes.shape}")
+
+        self.risk_types = list(risk_types)
+        self.codes = codes
+
+    @classmethod
+    def from_indicators(cls, indicators: list[dict[EnvironmentalRiskType, EnvironmentalRisk]], risk_types: list[EnvironmentalRiskType] = None) -> "RiskResults":
+        ''' Build the results from the risk indicators of each location (as returned by RiskManager.get_indicators), the missing risk types being NO_DATA'''
+        risk_types = list(EnvironmentalRiskType) if risk_types is None else risk_types
+
+        codes = np.zeros((len(risk_types), len(indicators)), dtype=np.uint8)
+        for i, risk_type in enumerate(risk_types):
+            codes[i] = [location_indicators.get(risk_type, EnvironmentalRisk.NO_DATA).value for location_indicators in indicators]
+
+        return cls(risk_types, codes)
+
+    @classmethod
+    def from_packed_codes(cls, packed_codes: np.ndarray) -> "RiskResults":
+        ''' Build the results from the codes of a RiskGrid (RiskGrid.get_codes), unpacking all of them at once'''
+        from risk_getters.risk_grid import BITS_PER_RISK_TYPE, HETEROGENEOUS_FLAG, RISK_TYPES
+
+        packed_codes = np.asarray(packed_codes, dtype=np.uint16) & np.uint16(~HETEROGENEOUS_FLAG & 0xFFFF)
+        shifts = np.arange(len(RISK_TYPES), dtype=np.uint16)[:, None] * BITS_PER_RISK_TYPE
+
+        return cls(RISK_TYPES, ((packed_codes[None, :] >> shifts) & ((1 << BITS_PER_RISK_TYPE) - 1)).astype(np.uint8))
+
+    def __len__(self) -> int:
+        return self.codes.shape[1]
+
+    def __getitem__(self, risk_type: EnvironmentalRiskType) -> np.ndarray:
+        ''' Return the column (a view) of the EnvironmentalRisk values of risk_type'''
+        return self.codes[self.risk_types.index(risk_type)]
+
+    def get_indicators(self, index: int) -> dict[EnvironmentalRiskType, EnvironmentalRisk]:
+        ''' Return the risk indicators of the location at index as a dictionary (as returned by RiskManager.get_indicators)'''
+        return {risk_type: EnvironmentalRisk(int(code)) for risk_type, code in zip(self.risk_types, self.codes[:, index])}
+
+    def to_labels(self, risk_type: EnvironmentalRiskType) -> np.ndarray:
+        ''' Return the "low", "medium" and "high" labels of risk_type (NO_DATA and VERY_LOW are "low")'''
+        return RISK_LABELS[self[risk_type]]
+
+    def to_scores(self, risk_type: EnvironmentalRiskType) -> np.ndarray:
+        ''' Return the 0 (NO_DATA) to 4 (HIGH) scores of risk_type'''
+        return RISK_SCORES[self[risk_type]]
+
+    def to_numpy(self) -> np.ndarray:
+        ''' Return the (number of risk types, number of locations) array of the EnvironmentalRisk values (not a copy)'''
+        return self.codes
+
+    def to_pandas(self, categorical: bool = False):
+        ''' Return a pandas DataFrame with a column per risk type (named after it) backed by the arrays of the results.
+            If categorical is True the columns are categoricals of the risk level names instead of the EnvironmentalRisk values'''
+        import pandas as pd
+
+        if categorical:
+            columns = {risk_type.name: pd.Categorical.from_codes(self.codes[i], categories=RISK_NAMES) for i, risk_type in enumerate(self.risk_types)}
+        else:
+            columns = {risk_type.name: self.codes[i] for i, risk_type in enumerate(self.risk_types)}
+
+        return pd.DataFrame(columns, copy=False)
+
+    def to_arrow(self, categorical: bool = False):
+        ''' Return a pyarrow Table with a uint8 column per risk type (named after it) sharing the buffers of the results.
+            If categorical is True the columns are dictionary arrays of the risk level names'''
+        import pyarrow as pa
+
+        if categorical:
+            dictionary = pa.array(RISK_NAMES)
+            columns = [pa.DictionaryArray.from_arrays(pa.array(self.codes[i]), dictionary) for i in range(len(self.risk_types))]
+        else:
+            columns = [pa.array(self.codes[i]) for i in range(len(self.risk_types))]
+
+        return pa.table(columns, names=[risk_type.name for risk_type in self.risk_types])
+
+    def to_parquet(self, file_path: str, categorical: bool = False):
+        ''' Write the results as a Parquet file with a column per risk type'''
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(categorical), file_path)
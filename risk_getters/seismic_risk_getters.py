@@ -1,14 +1,23 @@
+from __future__ import annotations
 from abc import ABC
-
-import rasterio
-import matplotlib.pyplot as plt
+from typing import TYPE_CHECKING, Iterator
 import numpy as np
-import matplotlib.colors as mcolors
 from utility.loaders import FilePathLoader
 from api_interfaces.thinkhazard_API import ThinkHazardAPI
+from risk_getters.dataset_manager import DatasetManager, default_dataset_manager
 from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
 from risk_getters.riskInterfaces import RiskGetter
 
+# Rasterio is imported when first used, to keep the import of the getters fast
+if TYPE_CHECKING:
+    from rasterio.windows import Window
+
+# Minimum PGA (Peak Ground Acceleration) of the LOW, MEDIUM and HIGH risk levels
+PGA_THRESHOLDS = [0.03, 0.13, 0.35]
+
+# Maximum number of cells of the supersampled grid on which the footprints are rasterized together (the map is not supersampled beyond it)
+MAX_SUPERSAMPLED_CELLS = 1 << 24
+
 
 class SeismicRiskGetter(RiskGetter, ABC):
     pass
@@ -16,42 +25,30 @@ class SeismicRiskGetter(RiskGetter, ABC):
 class SeismicRiskMap(RiskGetter):
     ''' Return the seismic risk indicator for a specific location using a raster file representing the geographic map areas and associated risk values'''
 
-    def __init__(self, file_data: str, file_path_loader : FilePathLoader):
+    def __init__(self, file_data: str, file_path_loader : FilePathLoader, bounds: tuple = None, dataset_manager: DatasetManager = None):
+        self.file_path_loader = file_path_loader
         self.map_path = file_path_loader.load_path(file_data)
 
-        # Define the PGA ranges and labels
-        self.pga_ranges = [0.00, 0.01, 0.02, 0.03, 0.05, 0.08, 0.13, 0.20, 0.35, 0.55, 0.90, 1.50]
-        self.labels = [
-            "Very Low 1", "Very Low 2", "Very Low 3", "Low 1", "Low 2",
-            "Low 3", "Medium 1", "Medium 2", "High 1", "High 2", "High 3"
-        ]
-
-        # Define variables for plots
-        # Define and convert RGB to values between 0 and 1 for matplotlib
-        self.rgb_colors = [
-            [255, 255, 255],  # 0.00-0.01
-            [215, 227, 238],  # 0.01-0.02
-            [181, 202, 255],  # 0.02-0.03
-            [143, 179, 255],  # 0.03-0.05
-            [127, 151, 255],  # 0.05-0.08
-            [171, 207, 99],  # 0.08-0.13
-            [232, 245, 158],  # 0.13-0.20
-            [255, 250, 20],  # 0.20-0.35
-            [255, 209, 33],  # 0.35-0.55
-            [255, 163, 10],  # 0.55-0.90
-            [255, 76, 0]  # 0.90-1.50
-        ]
-        self.rgb_colors = np.array(self.rgb_colors) / 255.0
-
-        # Create a ListedColormap
-        self.cmap = mcolors.ListedColormap(self.rgb_colors)
-
-        # Normalize the PGA ranges to [0, 1]
-        self.norm = mcolors.BoundaryNorm(boundaries=self.pga_ranges, ncolors=len(self.rgb_colors))
+        # Checksum of the map (computed when first requested)
+        self.data_version = None
+
+        # If bounds (min_longitude, min_latitude, max_longitude, max_latitude) are given only the window covering them is loaded (in memory),
+        # kept by the dataset manager, which may evict it and load it again when needed. Its key includes the signature of the file,
+        # so that a replaced map is not confused with the one in memory
+        self.bounds = bounds
+        self.dataset_manager = default_dataset_manager if dataset_manager is None else dataset_manager
+        self.dataset_key = (type(self).__name__, self.map_path, bounds, file_path_loader.get_signature(self.map_path))
+        if bounds is not None:
+            self._get_window_dataset()
 
 
     def get_risk(self, longitude: float, latitude: float) -> EnvironmentalRisk:
         ''' Return the seismic risk by extracting the Peak Ground Acceleration for the geographic location given by (latitude, longitude) from the map and using thresholds similar to those used by the ThinkHazard API to assess the risk level'''
+        import rasterio
+
+        if self.bounds is not None:
+            return self._get_risk_from_window(longitude, latitude)
+
         with rasterio.open(self.map_path) as map:
             transform = map.transform
 
@@ -69,105 +66,260 @@ class SeismicRiskMap(RiskGetter):
                 # Read the raster value at the specific location
                 pga_value = map.read(1)[row, col]
 
-                if pga_value == map.nodata:
-                    return EnvironmentalRisk.NO_DATA
-                else:
-                    if pga_value < 0.03:
-                        return EnvironmentalRisk.VERY_LOW
-                    elif pga_value < 0.13:
-                        return EnvironmentalRisk.LOW
-                    elif pga_value < 0.35:
-                        return EnvironmentalRisk.MEDIUM
-                    else:
-                        return EnvironmentalRisk.HIGH
+                return self._get_risk_from_pga(pga_value, map.nodata)
+
+
+    def get_data_version(self, longitude: float, latitude: float) -> str:
+        ''' Return the checksum of the map'''
+        return self._get_checksum()
+
+    def _get_checksum(self) -> str:
+        ''' Return the checksum of the map, computed when first requested'''
+        if self.data_version is None:
+            self.data_version = self.file_path_loader.get_checksum(self.map_path)
+
+        return self.data_version
+
+    def is_data_current(self, version) -> bool:
+        ''' Return True if the risk has been computed with the current map'''
+        return version == self._get_checksum()
+
+
+    def _get_risk_from_window(self, longitude: float, latitude: float) -> EnvironmentalRisk:
+        ''' Return the seismic risk of the geographic location given by (latitude, longitude) from the window loaded in memory'''
+        import rasterio
+
+        window_data, transform, (row_off, col_off), nodata = self._get_window_dataset()
+
+        # The pixel is located on the whole map (as get_risk does) and then shifted to the window, the transform of the window
+        # having an origin rounded differently the pixels at the edges could otherwise differ
+        row, col = rasterio.transform.rowcol(transform, longitude, latitude)
+        row, col = row - row_off, col - col_off
 
+        if not (0 <= row < window_data.shape[0] and 0 <= col < window_data.shape[1]):
+            return EnvironmentalRisk.NO_DATA
+        else:
+            return self._get_risk_from_pga(window_data[row, col], nodata)
 
 
-    def plot(self, longitude: float, latitude: float):
-        ''' Plot the map and the location given by (latitude, longitude) '''
+    def get_dataset_keys(self) -> list:
+        ''' Return the keys of the datasets of the getter in the dataset manager'''
+        return [] if self.bounds is None else [self.dataset_key]
+
+    def _get_window_dataset(self) -> tuple:
+        ''' Return the PGA values of the window covering the bounds, the transform of the map, the (row, column) offset of the window and the nodata value from the dataset manager'''
+        return self.dataset_manager.acquire(self.dataset_key, self._load_window_dataset)
+
+    def _load_window_dataset(self) -> tuple:
+        ''' Read the window of the map covering the bounds'''
+        import rasterio
 
         with rasterio.open(self.map_path) as map:
-            # Read the first band of the raster
+            window = self._get_window(map, self.bounds)
+            return map.read(1, window=window), map.transform, (int(window.row_off), int(window.col_off)), map.nodata
+
+
+    def _get_risk_from_pga(self, pga_value: float, nodata: float) -> EnvironmentalRisk:
+        ''' Return the risk level associated to a Peak Ground Acceleration value'''
+        if pga_value == nodata:
+            return EnvironmentalRisk.NO_DATA
+        else:
+            if pga_value < PGA_THRESHOLDS[0]:
+                return EnvironmentalRisk.VERY_LOW
+            elif pga_value < PGA_THRESHOLDS[1]:
+                return EnvironmentalRisk.LOW
+            elif pga_value < PGA_THRESHOLDS[2]:
+                return EnvironmentalRisk.MEDIUM
+            else:
+                return EnvironmentalRisk.HIGH
+
+
+    def _get_risks_from_pga(self, pga_values: np.ndarray, nodata: float) -> np.ndarray:
+        ''' Return the risk levels (encoded as EnvironmentalRisk values) associated to an array of Peak Ground Acceleration values'''
+        levels = (np.digitize(pga_values, PGA_THRESHOLDS) + EnvironmentalRisk.VERY_LOW.value).astype(np.uint8)
+
+        return np.where(pga_values == nodata, EnvironmentalRisk.NO_DATA.value, levels).astype(np.uint8)
+
+
+    def _get_window(self, map, bounds: tuple) -> Window:
+        ''' Return the raster window (clipped to the raster) covering the bounds (min_longitude, min_latitude, max_longitude, max_latitude)'''
+        import rasterio
+        from rasterio.windows import Window
 
-            fig, ax = plt.subplots(figsize=(10, 10))
+        min_longitude, min_latitude, max_longitude, max_latitude = bounds
+        rows, cols = rasterio.transform.rowcol(map.transform, [min_longitude, max_longitude], [max_latitude, min_latitude])
 
-            # Read raster data
-            raster_data = map.read(1)
+        row_start, row_stop = max(min(rows), 0), min(max(rows) + 1, map.height)
+        col_start, col_stop = max(min(cols), 0), min(max(cols) + 1, map.width)
 
-            # Get raster bounds
-            bounds = map.bounds  # (left, bottom, right, top) in degrees
+        return Window.from_slices((row_start, max(row_stop, row_start)), (col_start, max(col_stop, col_start)))
 
-            # Plot the raster using imshow with the correct extent and aspect ratio
-            img = ax.imshow(raster_data, cmap=self.cmap, norm=self.norm,
-                            extent=[bounds.left, bounds.right, bounds.bottom, bounds.top],
-                            origin='upper')
 
-            # Add a colorbar with custom tick labels
-            cbar = plt.colorbar(img, ax=ax, boundaries=self.pga_ranges[:-1], ticks=self.pga_ranges[:-1],
-                                spacing='uniform')
-            cbar.ax.set_yticklabels(self.labels)
-            cbar.set_label('Risk Levels', rotation=270, labelpad=20)
+    def get_footprint_stats(self, footprints, supersample: int = 4, chunk_size: int = 512) -> list[dict]:
+        ''' Return the risk statistics of each footprint (shapely polygons, lines or points in EPSG:4326): the fraction of its area covered by each
+            risk level, the risk level covering the largest part and the maximum and (area-weighted) mean PGA ("max_pga", "mean_pga", None without data).
+            The footprints are grouped by the chunk of chunk_size x chunk_size pixels containing their top left corner (and in separate rounds if they
+            overlap) and each group is rasterized once over the window covering it, the index of the footprint being the burnt value, on a grid supersample
+            times finer than the map. Each pixel is weighted by its area and by the fraction of its cells covered by the footprint. The footprints too small
+            to cover a cell of that grid get the pixel of their representative point'''
+        import rasterio
+        import rasterio.features
+        import shapely
+        from risk_getters.footprints import get_footprint_stats_from_weights
 
-            # Plot the point (in geographic coordinates) on the map
-            ax.plot(longitude, latitude, 'ro', markersize=4)  # 'ro' for red circle
+        footprints = list(footprints)
+        geometries = np.empty(len(footprints), dtype=object)
+        geometries[:] = footprints
 
-            plt.title("PGA Location on the GEM Seismic Hazard Map")
-            plt.xlabel('Longitude')
-            plt.ylabel('Latitude')
-            plt.show()
+        n_levels = len(EnvironmentalRisk)
+        weights = np.zeros((len(geometries), n_levels))
+        max_pga = np.full(len(geometries), -np.inf)
+        pga_sums = np.zeros(len(geometries))
+        valid_weights = np.zeros(len(geometries))
 
+        if len(geometries) == 0:
+            return []
 
-    def plot_from_bounds(self, lower_bound: float, upper_bound: float):
-        ''' Plot the map and the points for which the PGA (Peak Ground Acceleration) is in the interval [lower_bound, upper_bound]'''
         with rasterio.open(self.map_path) as map:
-            # Read the raster data
-            raster_data = map.read(1)
-            transform = map.transform
+            bounds = shapely.bounds(geometries)
+            rows, cols = rasterio.transform.rowcol(map.transform, bounds[:, 0], bounds[:, 3])
+
+            groups = {}
+            for i, key in enumerate(zip(np.asarray(rows) // chunk_size, np.asarray(cols) // chunk_size, self._get_overlap_rounds(geometries))):
+                groups.setdefault(key, []).append(i)
+
+            for members in groups.values():
+                members = np.asarray(members)
+                window = self._get_window(map, (bounds[members, 0].min(), bounds[members, 1].min(), bounds[members, 2].max(), bounds[members, 3].max()))
+                if window.width == 0 or window.height == 0:
+                    continue
+
+                pga_values = map.read(1, window=window).ravel().astype(float)
+                height, width = int(window.height), int(window.width)
+                transform = map.window_transform(window)
+                levels = self._get_risks_from_pga(pga_values, map.nodata)
+
+                # The area of the pixels of a geographic raster is proportional to the cosine of their latitude
+                latitudes = transform.f + (np.arange(height) + 0.5) * transform.e
+                pixel_areas = np.repeat(np.cos(np.radians(latitudes)), width)
+
+                # Burn all the footprints of the group at once on the finer grid (0 where there is none)
+                factor = supersample if height * width * supersample ** 2 <= MAX_SUPERSAMPLED_CELLS else 1
+                burnt = rasterio.features.rasterize(((geometry, int(i) + 1) for geometry, i in zip(geometries[members], members)), fill=0, dtype="int32",
+                                                    out_shape=(height * factor, width * factor), transform=transform * rasterio.Affine.scale(1 / factor))
+                cell_rows, cell_cols = np.nonzero(burnt)
+                footprint_index = burnt[cell_rows, cell_cols].astype(np.int64) - 1
+                pixels = (cell_rows // factor) * width + cell_cols // factor
+
+                # The footprints without cells get the pixel of their representative point (as a single cell)
+                missing = np.setdiff1d(members, footprint_index)
+                if len(missing) > 0:
+                    points = shapely.point_on_surface(geometries[missing])
+                    point_rows, point_cols = (np.asarray(index) for index in rasterio.transform.rowcol(transform, shapely.get_x(points), shapely.get_y(points)))
+                    inside = (point_rows >= 0) & (point_rows < height) & (point_cols >= 0) & (point_cols < width)
+                    footprint_index = np.concatenate([footprint_index, missing[inside]])
+                    pixels = np.concatenate([pixels, point_rows[inside] * width + point_cols[inside]])
+
+                # Number of cells of each pixel covered by each footprint
+                pairs, counts = np.unique(footprint_index * (height * width) + pixels, return_counts=True)
+                pair_footprints, pair_pixels = pairs // (height * width), pairs % (height * width)
+                pair_weights = counts / factor ** 2 * pixel_areas[pair_pixels]
+                pair_levels = levels[pair_pixels]
+                np.add.at(weights, (pair_footprints, pair_levels), pair_weights)
+
+                valid = pair_levels != EnvironmentalRisk.NO_DATA.value
+                pair_pga = pga_values[pair_pixels]
+                np.maximum.at(max_pga, pair_footprints[valid], pair_pga[valid])
+                np.add.at(pga_sums, pair_footprints[valid], pair_pga[valid] * pair_weights[valid])
+                np.add.at(valid_weights, pair_footprints[valid], pair_weights[valid])
+
+        stats = get_footprint_stats_from_weights(weights, weights.sum(axis=1))
+        for i, footprint_stats in enumerate(stats):
+            has_pga = valid_weights[i] > 0
+            footprint_stats["max_pga"] = float(max_pga[i]) if has_pga else None
+            footprint_stats["mean_pga"] = float(pga_sums[i] / valid_weights[i]) if has_pga else None
+
+        return stats
+
+
+    def _get_overlap_rounds(self, geometries: np.ndarray) -> np.ndarray:
+        ''' Return the round of each geometry, such that the geometries of the same round do not overlap and can be rasterized together'''
+        import shapely
+
+        rounds = np.zeros(len(geometries), dtype=np.int64)
+
+        # Pairs of overlapping geometries (only touching at the border does not count)
+        first, second = shapely.STRtree(geometries).query(geometries, predicate="intersects")
+        first, second = first[first < second], second[first < second]
+        overlapping = ~shapely.touches(geometries[first], geometries[second])
+
+        # Greedy colouring, in order: each geometry gets the first round not used by the geometries before it that it overlaps
+        previous = {}
+        for i, j in zip(first[overlapping], second[overlapping]):
+            previous.setdefault(int(j), []).append(int(i))
+
+        for j in sorted(previous):
+            used = {int(rounds[i]) for i in previous[j]}
+            rounds[j] = min(set(range(len(used) + 1)) - used)
+
+        return rounds
+
+
+    def iter_areas(self, area, min_risk: EnvironmentalRisk, chunk_size: int = 1024) -> Iterator[dict]:
+        ''' Yield the GeoJSON features of the areas within area (a bounding box (min_longitude, min_latitude, max_longitude, max_latitude) or a shapely
+            geometry) whose risk is at least min_risk. The raster is read in chunks of about chunk_size x chunk_size pixels aligned with its blocks,
+            so the memory used does not depend on the size of the area, and the features are split at the chunk boundaries'''
+        import rasterio
+        import rasterio.features
+        from rasterio.windows import Window
+        from risk_getters.region_query import get_area, make_feature
+
+        area = get_area(area)
+        min_value = max(min_risk.value, EnvironmentalRisk.VERY_LOW.value)
+
+        with rasterio.open(self.map_path) as map:
+            area_window = self._get_window(map, area.bounds)
+
+            # Chunks made of whole blocks of the raster
+            block_height, block_width = map.block_shapes[0]
+            chunk_height = max(chunk_size // block_height, 1) * block_height
+            chunk_width = max(chunk_size // block_width, 1) * block_width
 
-            # Identify the NoData value (if applicable)
-            nodata_value = map.nodata
+            row_start, col_start = int(area_window.row_off), int(area_window.col_off)
+            row_stop, col_stop = row_start + int(area_window.height), col_start + int(area_window.width)
 
-            # Mask the NoData values (if needed)
-            if nodata_value is not None:
-                raster_data = np.ma.masked_equal(raster_data, nodata_value)
+            for row in range(row_start // chunk_height * chunk_height, row_stop, chunk_height):
+                for col in range(col_start // chunk_width * chunk_width, col_stop, chunk_width):
+                    row_slice = (max(row, row_start), min(row + chunk_height, row_stop))
+                    col_slice = (max(col, col_start), min(col + chunk_width, col_stop))
+                    window = Window.from_slices(row_slice, col_slice)
 
-            # Find indices where the values are within the specified range
-            target_indices = np.where((raster_data >= lower_bound) & (raster_data <= upper_bound))
+                    transform = map.window_transform(window)
+                    levels = self._get_risks_from_pga(map.read(1, window=window), map.nodata)
 
-            # Convert pixel indices to geographical coordinates
-            coordinates = []
-            for row, col in zip(*target_indices):
-                # Convert row, col (pixel) to x, y (coordinates)
-                x, y = transform * (col, row)  # (col, row) to (x, y)
-                coordinates.append((x, y))
+                    # Keep the pixels above the threshold whose center is inside the area
+                    mask = levels >= min_value
+                    if mask.any():
+                        mask &= rasterio.features.geometry_mask([area], out_shape=levels.shape, transform=transform, invert=True)
 
-            # Set up the plot with a larger figure size
-            fig, ax = plt.subplots(figsize=(15, 15))  # Increased size
+                    if mask.any():
+                        for geometry, level in rasterio.features.shapes(levels, mask=mask, transform=transform):
+                            yield make_feature(geometry, EnvironmentalRiskType.SEISMIC_RISK, EnvironmentalRisk(int(level)))
 
-            # Plot the raster using the custom colormap and normalization
-            img = ax.imshow(raster_data, cmap=self.cmap, norm=self.norm,
-                            extent=(map.bounds.left, map.bounds.right, map.bounds.bottom, map.bounds.top))
 
-            # Add a colorbar with non-proportional tick spacing
-            cbar = plt.colorbar(img, ax=ax, boundaries=self.pga_ranges, ticks=self.pga_ranges[:-1], spacing='uniform')
-            cbar.ax.set_yticklabels(self.labels)  # Set the correct number of labels
 
-            # Add a title to the colorbar for risk levels
-            cbar.set_label('Risk Levels', rotation=270, labelpad=20)
+    def plot(self, longitude: float, latitude: float, radius: float = None, max_size: int = 2000):
+        ''' Plot the map (only the area within radius degrees from the location if radius is given) and the location given by (latitude, longitude) '''
+        from risk_getters.visualization import plot_seismic_map
 
-            # Plot the extracted points on the map
-            if coordinates:  # Check if any coordinates were found
-                lon, lat = zip(*coordinates)
-                ax.scatter(lon, lat, color='red', marker='o', label='PGA > 0.90', s=0.0001)  # Plot points in red
-                ax.legend()  # Show legend
+        plot_seismic_map(self, longitude, latitude, radius, max_size)
 
-            # Set plot labels
-            plt.title("Seismic Hazard Map with PGA Levels", fontsize=18)
-            plt.xlabel("Longitude", fontsize=14)
-            plt.ylabel("Latitude", fontsize=14)
 
-            # Show the plot
-            plt.show()
+    def plot_from_bounds(self, lower_bound: float, upper_bound: float, bounds: tuple = None, max_size: int = 2000, max_points: int = 100000):
+        ''' Plot the map (only the area given by bounds if they are given) and the points for which the PGA (Peak Ground Acceleration) is in the interval [lower_bound, upper_bound]'''
+        from risk_getters.visualization import plot_seismic_map_from_bounds
+
+        plot_seismic_map_from_bounds(self, lower_bound, upper_bound, bounds, max_size, max_points)
 
 
 class SeismicRiskThAPI(SeismicRiskGetter):
@@ -184,6 +336,15 @@ class SeismicRiskThAPI(SeismicRiskGetter):
         return self.api.get_risk_level(longitude, latitude, self.RISK_TYPE)
 
 
+    def get_data_version(self, longitude: float, latitude: float):
+        ''' Return the version (ADM2 code and ETag or content hash) of the ThinkHazard report of the location'''
+        return self.api.get_report_version(longitude, latitude)
+
+    def is_data_current(self, version) -> bool:
+        ''' Return True if the ThinkHazard report has not changed since version'''
+        return self.api.is_report_current(version)
+
+
 
 
 
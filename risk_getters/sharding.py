@@ -0,0 +1,169 @@
+import math
+import multiprocessing
+from abc import ABC, abstractmethod
+from typing import Callable
+import numpy as np
+from risk_getters.enumerations import EnvironmentalRisk, EnvironmentalRiskType
+from risk_getters.riskInterfaces import RiskManager
+
+# Half size (in degrees) of the bounding box used by the map getters around a location: the shards load their tiles
+# enlarged by this margin so that the locations near the border of a tile get the same result as with the whole layers
+QUERY_MARGIN = 0.01
+
+
+class TileGrid:
+    ''' Fixed partition of the world in square tiles of tile_size degrees. The tiles are assigned to the shards in contiguous
+        bands of tile columns, so that the area of each shard is a single bounding box'''
+
+    def __init__(self, tile_size: float = 10.0, n_shards: int = 1):
+        self.tile_size = tile_size
+        self.n_cols = math.ceil(360 / tile_size)
+        self.n_rows = math.ceil(180 / tile_size)
+
+        if not 1 <= n_shards <= self.n_cols:
+            raise ValueError(f"The number of shards must be between 1 and the number of tile columns ({self.n_cols})")
+        self.n_shards = n_shards
+
+    def get_tiles(self, longitudes, latitudes) -> tuple[np.ndarray, np.ndarray]:
+        ''' Return the column and row of the tiles containing the locations given by (longitudes, latitudes)'''
+        cols = np.clip(np.floor((np.asarray(longitudes, dtype=float) + 180) / self.tile_size), 0, self.n_cols - 1).astype(np.int64)
+        rows = np.clip(np.floor((np.asarray(latitudes, dtype=float) + 90) / self.tile_size), 0, self.n_rows - 1).astype(np.int64)
+        return cols, rows
+
+    def get_shards(self, longitudes, latitudes) -> np.ndarray:
+        ''' Return the shard responsible for each location given by (longitudes, latitudes)'''
+        cols, _ = self.get_tiles(longitudes, latitudes)
+        return cols * self.n_shards // self.n_cols
+
+    def get_shard_tiles(self, shard: int) -> list[tuple[int, int]]:
+        ''' Return the (column, row) tiles assigned to the shard'''
+        cols = np.nonzero(np.arange(self.n_cols) * self.n_shards // self.n_cols == shard)[0]
+        return [(int(col), row) for col in cols for row in range(self.n_rows)]
+
+    def get_shard_bounds(self, shard: int, margin: float = QUERY_MARGIN) -> tuple[float, float, float, float]:
+        ''' Return the bounds (min_longitude, min_latitude, max_longitude, max_latitude) of the tiles of the shard enlarged by margin'''
+        cols = [col for col, _ in self.get_shard_tiles(shard)]
+        return (-180 + min(cols) * self.tile_size - margin, -90 - margin,
+                min(-180 + (max(cols) + 1) * self.tile_size, 180) + margin, 90 + margin)
+
+
+
+class Shard(ABC):
+    ''' A node holding the slices of the hazard layers of some tiles and evaluating the locations falling in them'''
+
+    @abstractmethod
+    def submit(self, locations: list[tuple[float, float]]):
+        ''' Send a batch of (longitude, latitude) locations to the shard'''
+        pass
+
+    @abstractmethod
+    def result(self) -> list[dict[EnvironmentalRiskType, EnvironmentalRisk]]:
+        ''' Wait and return the risk indicators of the last submitted batch, in input order'''
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+def _run_local_shard(risk_manager_factory: Callable[[tuple], RiskManager], bounds: tuple, connection):
+    ''' Main loop of a local shard process'''
+    risk_manager = risk_manager_factory(bounds)
+
+    while True:
+        locations = connection.recv()
+        if locations is None:
+            break
+
+        try:
+            connection.send(risk_manager.get_indicators_batch(locations))
+        except Exception as e:
+            connection.send(e)
+
+    connection.close()
+
+
+class LocalShard(Shard):
+    ''' Shard served by a local process (stand-in for a node). The process builds its RiskManager by calling
+        risk_manager_factory(bounds), which must be a picklable (module level) function creating the getters restricted to bounds'''
+
+    def __init__(self, risk_manager_factory: Callable[[tuple], RiskManager], bounds: tuple, mp_context=None):
+        context = mp_context or multiprocessing.get_context("spawn")
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_run_local_shard, args=(risk_manager_factory, bounds, child_connection), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def submit(self, locations: list[tuple[float, float]]):
+        self.connection.send(locations)
+
+    def result(self) -> list[dict[EnvironmentalRiskType, EnvironmentalRisk]]:
+        result = self.connection.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        if self.process.is_alive():
+            self.connection.send(None)
+            self.process.join()
+        self.connection.close()
+
+
+
+class ShardCoordinator:
+    ''' Route batches of locations to the shards responsible for their tiles and merge the results in input order'''
+
+    def __init__(self, grid: TileGrid, shards: list[Shard]):
+        if len(shards) != grid.n_shards:
+            raise ValueError(f"Expected {grid.n_shards} shards, got {len(shards)}")
+
+        self.grid = grid
+        self.shards = shards
+
+    @classmethod
+    def with_local_shards(cls, grid: TileGrid, risk_manager_factory: Callable[[tuple], RiskManager], mp_context=None) -> "ShardCoordinator":
+        ''' Create a coordinator whose shards are local processes, each one loading only the slices of its tiles'''
+        shards = [LocalShard(risk_manager_factory, grid.get_shard_bounds(shard), mp_context) for shard in range(grid.n_shards)]
+        return cls(grid, shards)
+
+    def get_indicators_batch(self, locations: list[tuple[float, float]]) -> list[dict[EnvironmentalRiskType, EnvironmentalRisk]]:
+        ''' Return the risk indicators for each (longitude, latitude) location of the batch, in input order'''
+        locations = list(locations)
+        if not locations:
+            return []
+
+        longitudes, latitudes = np.asarray(locations, dtype=float).T
+        shard_ids = self.grid.get_shards(longitudes, latitudes)
+
+        # Send every shard its part of the batch, so that the shards work concurrently
+        positions_per_shard = {}
+        for shard in np.unique(shard_ids):
+            positions = np.nonzero(shard_ids == shard)[0]
+            self.shards[shard].submit([locations[i] for i in positions])
+            positions_per_shard[int(shard)] = positions
+
+        # Merge the results in input order (all the shards are drained before raising an error)
+        result = [None] * len(locations)
+        error = None
+        for shard, positions in positions_per_shard.items():
+            try:
+                for position, indicators in zip(positions, self.shards[shard].result()):
+                    result[position] = indicators
+            except Exception as e:
+                error = error or e
+
+        if error is not None:
+            raise error
+
+        return result
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,216 @@
+''' Plots of the map-based risk getters. This module (and matplotlib) is only imported when a plot is requested'''
+import geopandas as gpd
+import matplotlib.colors as mcolors
+import matplotlib.pyplot as plt
+import numpy as np
+import rasterio
+import rasterio.transform
+import rasterio.windows
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+from shapely.geometry import Point
+from risk_getters.enumerations import EnvironmentalRisk
+
+# Define the PGA ranges and labels of the seismic map
+PGA_RANGES = [0.00, 0.01, 0.02, 0.03, 0.05, 0.08, 0.13, 0.20, 0.35, 0.55, 0.90, 1.50]
+PGA_LABELS = [
+    "Very Low 1", "Very Low 2", "Very Low 3", "Low 1", "Low 2",
+    "Low 3", "Medium 1", "Medium 2", "High 1", "High 2", "High 3"
+]
+
+# Define and convert RGB to values between 0 and 1 for matplotlib
+PGA_RGB_COLORS = np.array([
+    [255, 255, 255],  # 0.00-0.01
+    [215, 227, 238],  # 0.01-0.02
+    [181, 202, 255],  # 0.02-0.03
+    [143, 179, 255],  # 0.03-0.05
+    [127, 151, 255],  # 0.05-0.08
+    [171, 207, 99],  # 0.08-0.13
+    [232, 245, 158],  # 0.13-0.20
+    [255, 250, 20],  # 0.20-0.35
+    [255, 209, 33],  # 0.35-0.55
+    [255, 163, 10],  # 0.55-0.90
+    [255, 76, 0]  # 0.90-1.50
+]) / 255.0
+
+# Create a ListedColormap
+PGA_CMAP = mcolors.ListedColormap(PGA_RGB_COLORS)
+
+# Normalize the PGA ranges to [0, 1]
+PGA_NORM = mcolors.BoundaryNorm(boundaries=PGA_RANGES, ncolors=len(PGA_RGB_COLORS))
+
+
+def _get_point_dataframe(longitude: float, latitude: float, crs) -> gpd.GeoDataFrame:
+    ''' Create the point associated to the location given by (latitude, longitude) in the reference system crs'''
+    point = Point(longitude, latitude)
+    point_gdf = gpd.GeoDataFrame(index=[0], crs="EPSG:4326", geometry=[point])
+
+    # Adjust the reference system
+    return point_gdf.to_crs(crs)
+
+
+def plot_flood_map(flood_map, longitude: float, latitude: float):
+    ''' Get the risk associated to the location given by (latitude, longitude) from a FloodRiskMap and plot the map of that risk level and the location'''
+
+    risk = flood_map.get_risk(longitude, latitude)
+
+    point_gdf = _get_point_dataframe(longitude, latitude, flood_map.map_low.crs)
+
+    # Plot the shapefile
+    ax = None
+    if risk == EnvironmentalRisk.VERY_LOW or risk == EnvironmentalRisk.LOW or risk == EnvironmentalRisk.NO_DATA:
+        ax = flood_map.map_low.plot(color='lightblue', figsize=(10, 10))
+    elif risk == EnvironmentalRisk.MEDIUM:
+        ax = flood_map.map_medium.plot(color='lightblue', figsize=(10, 10))
+    elif risk == EnvironmentalRisk.HIGH:
+        ax = flood_map.map_high.plot(color='lightblue', figsize=(10, 10))
+
+    # Plot the point
+    point_gdf.plot(ax=ax, color='red', markersize=50)
+    plt.title("Shapefile and Point Location")
+    plt.show()
+
+
+def plot_landslide_map(landslide_map, longitude: float, latitude: float):
+    ''' Plot the map of a LandslideRiskMap and the location given by (latitude, longitude)'''
+
+    point_gdf = _get_point_dataframe(longitude, latitude, landslide_map.map.crs)
+
+    # Plot the map
+    ax = landslide_map.map.plot(color='lightblue', cmap='OrRd', legend=True, figsize=(10, 10))
+
+    # Plot the point
+    point_gdf.plot(ax=ax, color='blue', markersize=10)
+    plt.title("Shapefile and Point Location")
+    plt.show()
+
+
+def build_overviews(map_path: str, factors: list[int] = None) -> bool:
+    ''' Build the (external, .ovr) overviews of the raster at map_path if it has none. Return False if they are missing and cannot be built'''
+    with rasterio.open(map_path) as map:
+        if map.overviews(1):
+            return True
+
+    factors = factors or [2, 4, 8, 16, 32, 64]
+    try:
+        # The overviews are written in a separate file so that the raster itself (and its checksum) is not modified
+        with rasterio.Env(TIFF_USE_OVR=True):
+            with rasterio.open(map_path, 'r+') as map:
+                map.build_overviews(factors, Resampling.nearest)
+        return True
+    except Exception:
+        return False
+
+
+def _read_decimated(map, window: Window, max_size: int) -> tuple[np.ndarray, Affine]:
+    ''' Read the first band in the window decimated so that no side is larger than max_size pixels (using the overviews when available)
+        and return it with its transform'''
+    scale = max(window.width / max_size, window.height / max_size, 1)
+    out_shape = (max(int(window.height / scale), 1), max(int(window.width / scale), 1))
+
+    raster_data = map.read(1, window=window, out_shape=out_shape, resampling=Resampling.nearest)
+    transform = map.window_transform(window) * Affine.scale(window.width / out_shape[1], window.height / out_shape[0])
+
+    return raster_data, transform
+
+
+def _get_plot_window(seismic_map, map, bounds: tuple) -> Window:
+    ''' Return the window covering bounds (min_longitude, min_latitude, max_longitude, max_latitude) or the whole raster if bounds is None'''
+    if bounds is None:
+        return Window(0, 0, map.width, map.height)
+    return seismic_map._get_window(map, bounds)
+
+
+def plot_seismic_map(seismic_map, longitude: float, latitude: float, radius: float = None, max_size: int = 2000):
+    ''' Plot the map of a SeismicRiskMap and the location given by (latitude, longitude). Only the area within radius degrees from
+        the location is read (the whole map if radius is None), decimated to at most max_size pixels per side '''
+    bounds = None if radius is None else (longitude - radius, latitude - radius, longitude + radius, latitude + radius)
+    build_overviews(seismic_map.map_path)
+
+    with rasterio.open(seismic_map.map_path) as map:
+        fig, ax = plt.subplots(figsize=(10, 10))
+
+        # Read raster data
+        window = _get_plot_window(seismic_map, map, bounds)
+        raster_data, _ = _read_decimated(map, window, max_size)
+
+        # Get the bounds of the window
+        left, bottom, right, top = rasterio.windows.bounds(window, map.transform)
+
+        # Plot the raster using imshow with the correct extent and aspect ratio
+        img = ax.imshow(raster_data, cmap=PGA_CMAP, norm=PGA_NORM,
+                        extent=[left, right, bottom, top],
+                        origin='upper')
+
+        # Add a colorbar with custom tick labels
+        cbar = plt.colorbar(img, ax=ax, boundaries=PGA_RANGES[:-1], ticks=PGA_RANGES[:-1],
+                            spacing='uniform')
+        cbar.ax.set_yticklabels(PGA_LABELS)
+        cbar.set_label('Risk Levels', rotation=270, labelpad=20)
+
+        # Plot the point (in geographic coordinates) on the map
+        ax.plot(longitude, latitude, 'ro', markersize=4)  # 'ro' for red circle
+
+        plt.title("PGA Location on the GEM Seismic Hazard Map")
+        plt.xlabel('Longitude')
+        plt.ylabel('Latitude')
+        plt.show()
+
+
+def plot_seismic_map_from_bounds(seismic_map, lower_bound: float, upper_bound: float, bounds: tuple = None, max_size: int = 2000, max_points: int = 100000):
+    ''' Plot the map of a SeismicRiskMap and the points for which the PGA (Peak Ground Acceleration) is in the interval [lower_bound, upper_bound].
+        Only the area given by bounds (min_longitude, min_latitude, max_longitude, max_latitude) is read (the whole map if bounds is None),
+        decimated to at most max_size pixels per side, and at most max_points points are drawn'''
+    build_overviews(seismic_map.map_path)
+
+    with rasterio.open(seismic_map.map_path) as map:
+        # Read the raster data
+        window = _get_plot_window(seismic_map, map, bounds)
+        raster_data, transform = _read_decimated(map, window, max_size)
+
+        # Identify the NoData value (if applicable)
+        nodata_value = map.nodata
+
+        # Mask the NoData values (if needed)
+        if nodata_value is not None:
+            raster_data = np.ma.masked_equal(raster_data, nodata_value)
+
+        # Find indices where the values are within the specified range
+        rows, cols = np.nonzero(np.ma.filled((raster_data >= lower_bound) & (raster_data <= upper_bound), False))
+
+        # Keep an evenly spaced subset of the points if they are too many to be drawn
+        if len(rows) > max_points:
+            keep = np.linspace(0, len(rows) - 1, max_points).astype(np.int64)
+            rows, cols = rows[keep], cols[keep]
+
+        # Convert pixel indices (centers) to geographical coordinates
+        xs, ys = rasterio.transform.xy(transform, rows, cols)
+
+        # Set up the plot with a larger figure size
+        fig, ax = plt.subplots(figsize=(15, 15))  # Increased size
+
+        # Plot the raster using the custom colormap and normalization
+        left, bottom, right, top = rasterio.windows.bounds(window, map.transform)
+        img = ax.imshow(raster_data, cmap=PGA_CMAP, norm=PGA_NORM,
+                        extent=(left, right, bottom, top))
+
+        # Add a colorbar with non-proportional tick spacing
+        cbar = plt.colorbar(img, ax=ax, boundaries=PGA_RANGES, ticks=PGA_RANGES[:-1], spacing='uniform')
+        cbar.ax.set_yticklabels(PGA_LABELS)  # Set the correct number of labels
+
+        # Add a title to the colorbar for risk levels
+        cbar.set_label('Risk Levels', rotation=270, labelpad=20)
+
+        # Plot the extracted points on the map
+        if len(rows) > 0:  # Check if any coordinates were found
+            ax.scatter(xs, ys, color='red', marker='o', label=f'{lower_bound} <= PGA <= {upper_bound}', s=0.0001)  # Plot points in red
+            ax.legend()  # Show legend
+
+        # Set plot labels
+        plt.title("Seismic Hazard Map with PGA Levels", fontsize=18)
+        plt.xlabel("Longitude", fontsize=14)
+        plt.ylabel("Latitude", fontsize=14)
+
+        # Show the plot
+        plt.show()
@@ -0,0 +1,77 @@
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+# The modules of the repository are imported from its root, the tests directory (on the path before it) provides the constants
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(1, ROOT_DIR)
+
+
+class LocalHTTPServer:
+    ''' HTTP server on a free local port serving the files of a dictionary (Keys = path values = content), with range requests.
+        The content of the paths in interrupt is cut after the given number of bytes, once, to simulate a dropped connection'''
+
+    def __init__(self):
+        self.files = {}
+        self.interrupt = {}
+        self.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                range_header = self.headers.get("Range", None)
+                server.requests.append((self.path, range_header))
+
+                content = server.files.get(self.path, None)
+                if content is None:
+                    self.send_error(404)
+                    return
+
+                start = 0
+                if range_header is not None:
+                    start = int(re.match(r"bytes=(\d+)-", range_header).group(1))
+                    if start >= len(content):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(content)}")
+                        self.end_headers()
+                        return
+
+                self.send_response(206 if range_header is not None else 200)
+                if range_header is not None:
+                    self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+                self.send_header("Content-Length", str(len(content) - start))
+                self.end_headers()
+
+                cut = server.interrupt.pop(self.path, None)
+                self.wfile.write(content[start:] if cut is None else content[start:cut])
+                if cut is not None:
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def http_server():
+    server = LocalHTTPServer()
+    yield server
+    server.close()
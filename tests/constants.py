@@ -0,0 +1,12 @@
+# Constants used by the tests in place of the local constants module: the external APIs are served by local test servers
+import os
+
+THINKHAZARD_BASE_URL = os.environ.get("THINKHAZARD_BASE_URL", "http://127.0.0.1:9")
+ELECTRICITYMAPS_BASE_URL = "http://127.0.0.1:9"
+ELECTRICITYMAPS_API_KEY = "test"
+OPENWHEATHER_BASE_URL = "http://127.0.0.1:9"
+OPENWHEATHER_API_KEY = "test"
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CITIES = os.path.join(ROOT_DIR, "cities.csv")
+CITIES_WITH_COORDINATES = os.path.join(ROOT_DIR, "cities_with_coordinates.csv")
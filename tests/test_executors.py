@@ -0,0 +1,146 @@
+import csv
+import functools
+import json
+import pickle
+import numpy as np
+import pytest
+import api_interfaces.thinkhazard_API as thinkhazard_API
+from constants import CITIES_WITH_COORDINATES
+from api_interfaces.thinkhazard_API import ThinkHazardAPI
+from risk_getters.enumerations import EnvironmentalRiskType
+from risk_getters.executors import ProcessPoolRiskExecutor
+from risk_getters.flood_risk_getters import FloodRiskMap, RiverFloodRiskThAPI, UrbanFloodRiskThAPI
+from risk_getters.landslide_risk_getters import LandslideRiskMap, LandslideRiskThAPI
+from risk_getters.riskInterfaces import RiskManager
+from risk_getters.seismic_risk_getters import SeismicRiskMap, SeismicRiskThAPI
+from risk_getters.sharding import ShardCoordinator, TileGrid
+from utility.loaders import FilePathLoader
+
+# Extent of the synthetic maps, across the border (longitude 0) of two shards
+MIN_LONGITUDE, MIN_LATITUDE, MAX_LONGITUDE, MAX_LATITUDE = -4.0, 43.0, 4.0, 47.0
+
+HAZARD_TYPES = ["River flood", "Urban flood", "Landslide", "Earthquake"]
+HAZARD_LEVELS = ["Very low", "Low", "Medium", "High", "No Data"]
+
+
+class LocalFilePathLoader(FilePathLoader):
+    ''' The file data are the paths of local files'''
+
+    def load_path(self, file_data):
+        return file_data
+
+
+def make_risk_manager(data_dir: str, bounds: tuple = None) -> RiskManager:
+    ''' Return the standard getter chain (ThinkHazard first, then the maps) over the synthetic maps of data_dir, restricted to bounds if given'''
+    loader = LocalFilePathLoader()
+    api = ThinkHazardAPI()
+
+    flood_map = FloodRiskMap(f"{data_dir}/flood_low.shp", f"{data_dir}/flood_medium.shp", f"{data_dir}/flood_high.shp", loader, bounds)
+    return RiskManager({EnvironmentalRiskType.SEISMIC_RISK: [SeismicRiskThAPI(api), SeismicRiskMap(f"{data_dir}/pga.tif", loader, bounds)],
+                        EnvironmentalRiskType.LANDSLIDE_RISK: [LandslideRiskThAPI(api), LandslideRiskMap(f"{data_dir}/landslide.shp", loader, bounds)],
+                        EnvironmentalRiskType.FLOOD_RIVER_RISK: [RiverFloodRiskThAPI(api), flood_map],
+                        EnvironmentalRiskType.FLOOD_URBAN_RISK: [UrbanFloodRiskThAPI(api), flood_map]})
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory):
+    import geopandas as gpd
+    import rasterio
+    import shapely
+    from rasterio.transform import from_origin
+
+    data_dir = tmp_path_factory.mktemp("maps")
+    rng = np.random.default_rng(0)
+
+    def make_areas(n: int, crs: str) -> gpd.GeoDataFrame:
+        x, y = rng.uniform(MIN_LONGITUDE, MAX_LONGITUDE, n), rng.uniform(MIN_LATITUDE, MAX_LATITUDE, n)
+        size = rng.uniform(0.01, 0.2, n)
+        return gpd.GeoDataFrame(geometry=shapely.box(x, y, x + size, y + size), crs="EPSG:4326").to_crs(crs)
+
+    for name in ["low", "medium", "high"]:
+        make_areas(400, "EPSG:3857").to_file(data_dir / f"flood_{name}.shp")
+
+    landslide = make_areas(600, "EPSG:32631")
+    landslide["per_fr_ita"] = rng.choice(['Aree di Attenzione AA', 'Moderata P1', 'Media P2', 'Elevata P3', 'Molto elevata P4', 'Altro'], len(landslide))
+    landslide.to_file(data_dir / "landslide.shp")
+
+    pga = rng.uniform(0, 0.6, (900, 1800)).astype("float32")
+    pga[:, 900:905] = -9999
+    with rasterio.open(data_dir / "pga.tif", "w", driver="GTiff", height=900, width=1800, count=1, dtype="float32", crs="EPSG:4326",
+                       transform=from_origin(-180, 90, 0.2, 0.2), nodata=-9999, tiled=True, blockxsize=256, blockysize=256) as dataset:
+        dataset.write(pga, 1)
+
+    return str(data_dir)
+
+
+@pytest.fixture(scope="module")
+def thinkhazard_server(request):
+    from conftest import LocalHTTPServer
+
+    server = LocalHTTPServer()
+
+    # Reports for two thirds of the ADM2 codes, some of them without some hazard types or with "No Data"
+    with open(CITIES_WITH_COORDINATES, newline='', encoding='utf-8') as file:
+        adm2_codes = [row[0] for row in list(csv.reader(file, delimiter=';'))[1:]]
+
+    for adm2_code in adm2_codes:
+        seed = int(adm2_code)
+        if seed % 3 != 0:
+            report = [{"hazardtype": {"hazardtype": hazard_type}, "hazardlevel": {"title": HAZARD_LEVELS[(seed // 3 + i) % len(HAZARD_LEVELS)]}}
+                      for i, hazard_type in enumerate(HAZARD_TYPES) if (seed + i) % 4 != 0]
+            server.files[f"/report/{adm2_code}.json"] = json.dumps(report).encode()
+
+    # The workers read the URL from the constants, the modules already imported are patched
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv("THINKHAZARD_BASE_URL", server.url)
+    monkeypatch.setattr(thinkhazard_API, "THINKHAZARD_BASE_URL", server.url)
+
+    yield server
+
+    monkeypatch.undo()
+    server.close()
+
+
+@pytest.fixture(scope="module")
+def locations():
+    rng = np.random.default_rng(1)
+    locations = list(zip(rng.uniform(MIN_LONGITUDE, MAX_LONGITUDE, 150), rng.uniform(MIN_LATITUDE, MAX_LATITUDE, 150)))
+
+    # Edges of the pixels of the seismic map, close to the border of the shards and outside the maps
+    return [(float(longitude), float(latitude)) for longitude, latitude in locations] + [(0.0, 45.0), (-0.2, 44.0), (0.2, 46.2), (1.0, 45.0), (30.0, 10.0)]
+
+
+def test_getter_chain_is_picklable(data_dir, thinkhazard_server):
+    risk_manager = make_risk_manager(data_dir)
+
+    copy = pickle.loads(pickle.dumps(risk_manager.risk_getters_per_type))
+
+    assert RiskManager(copy).get_indicators(1.0, 45.0) == risk_manager.get_indicators(1.0, 45.0)
+
+
+def test_process_pool_executor_matches_risk_manager(data_dir, thinkhazard_server, locations):
+    risk_manager = make_risk_manager(data_dir)
+    expected = risk_manager.get_indicators_batch(locations)
+
+    with ProcessPoolRiskExecutor(risk_manager, max_workers=2, chunk_size=40) as executor:
+        assert executor.get_indicators_batch(locations) == expected
+
+
+def test_shard_coordinator_matches_risk_manager(data_dir, thinkhazard_server, locations):
+    expected = make_risk_manager(data_dir).get_indicators_batch(locations)
+
+    # Shards of 90 degrees of longitude, the maps are split between the second and the third one
+    grid = TileGrid(tile_size=90.0, n_shards=4)
+    with ShardCoordinator.with_local_shards(grid, functools.partial(make_risk_manager, data_dir)) as coordinator:
+        assert coordinator.get_indicators_batch(locations) == expected
+
+
+def test_windowed_seismic_map_matches_whole_map(data_dir):
+    loader = LocalFilePathLoader()
+    whole_map = SeismicRiskMap(f"{data_dir}/pga.tif", loader)
+    window_map = SeismicRiskMap(f"{data_dir}/pga.tif", loader, bounds=(0.01, 40.0, 10.01, 50.0))
+
+    # Locations on the edges of the pixels (0.2 degrees)
+    locations = [(longitude, latitude) for longitude in np.arange(0.2, 10, 0.2) for latitude in np.arange(40.2, 50, 0.2)] + [(9.0, 45.0)]
+
+    assert [window_map.get_risk(*location) for location in locations] == [whole_map.get_risk(*location) for location in locations]
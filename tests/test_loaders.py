@@ -0,0 +1,125 @@
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+from utility.loaders import FilePathLoaderFromURL
+
+
+def make_tar(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def make_zip(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for name, content in files.items():
+            zip_file.writestr(name, content)
+    return buffer.getvalue()
+
+
+def make_tar_member(archive: bytes, name: str) -> bytes:
+    with tarfile.open(fileobj=io.BytesIO(archive), mode="r:*") as tar:
+        return tar.extractfile(name).read()
+
+
+def sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def test_resume_after_dropped_connection(http_server, tmp_path):
+    content = os.urandom(3 * 1024 * 1024)
+    http_server.files["/maps/pga.tif"] = content
+    http_server.interrupt["/maps/pga.tif"] = len(content) // 2
+
+    loader = FilePathLoaderFromURL(str(tmp_path), retries=2)
+    loader.CHUNK_SIZE = 64 * 1024
+    path = loader.load_path({"url": http_server.url + "/maps/pga.tif", "name": "pga", "type": ".tif", "sha256": sha256(content)})
+
+    with open(path, "rb") as file:
+        assert file.read() == content
+
+    # The second attempt asked only for the missing part
+    ranges = [range_header for _, range_header in http_server.requests]
+    assert ranges[0] is None
+    assert ranges[1] is not None and int(ranges[1][len("bytes="):-1]) > 0
+
+
+def test_resume_from_previous_run(http_server, tmp_path):
+    content = make_tar({"data/landslide.shp": os.urandom(200000), "data/landslide.dbf": b"dbf"})
+    http_server.files["/landslide.tar.gz"] = content
+    file_data = {"url": http_server.url + "/landslide.tar.gz", "name": "landslide", "type": ".shp", "sha256": sha256(content)}
+
+    # Part of the archive left by an interrupted run
+    extract_dir = os.path.dirname(os.path.dirname(FilePathLoaderFromURL(str(tmp_path)).load_path(file_data)))
+    download_path = extract_dir + ".tar.gz"
+    os.remove(download_path)
+    with open(download_path + ".part", "wb") as part_file:
+        part_file.write(content[:100000])
+    http_server.requests.clear()
+
+    path = FilePathLoaderFromURL(str(tmp_path)).load_path(file_data)
+
+    assert http_server.requests == [("/landslide.tar.gz", "bytes=100000-")]
+    assert os.path.basename(path) == "landslide.shp"
+    with open(path, "rb") as file:
+        assert file.read() == make_tar_member(content, "data/landslide.shp")
+
+
+@pytest.mark.parametrize("archive", ["tar", "zip"])
+def test_checksum_mismatch_leaves_no_extracted_files(http_server, tmp_path, archive):
+    files = {"flood.shp": b"shp", "flood.dbf": b"dbf"}
+    content = make_tar(files) if archive == "tar" else make_zip(files)
+    http_server.files[f"/flood.{archive}"] = content
+    file_data = {"url": http_server.url + f"/flood.{archive}", "name": "flood", "type": ".shp", "sha256": sha256(b"something else")}
+
+    loader = FilePathLoaderFromURL(str(tmp_path))
+    with pytest.raises(ValueError):
+        loader.load_path(file_data)
+
+    # Neither the archive nor any of its members are left to be used by the next run
+    assert not any(name.endswith(".shp") for _, _, names in os.walk(tmp_path) for name in names)
+    assert not any(name.startswith("flood") for name in os.listdir(tmp_path))
+
+    # With the right checksum the dataset is available
+    path = loader.load_path(dict(file_data, sha256=sha256(content)))
+    with open(path, "rb") as file:
+        assert file.read() == b"shp"
+
+
+def test_urls_with_the_same_basename(http_server, tmp_path):
+    http_server.files["/low/data.zip"] = make_zip({"flood_low.shp": b"low"})
+    http_server.files["/high/data.zip"] = make_zip({"flood_high.shp": b"high"})
+    http_server.files["/download?id=1"] = b"first"
+    http_server.files["/download?id=2"] = b"second"
+
+    files_data = [{"url": http_server.url + "/low/data.zip", "name": "flood_low", "type": ".shp"},
+                  {"url": http_server.url + "/high/data.zip", "name": "flood_high", "type": ".shp"},
+                  {"url": http_server.url + "/download?id=1", "name": "first", "type": ".txt"},
+                  {"url": http_server.url + "/download?id=2", "name": "second", "type": ".txt"}]
+
+    # Concurrently and then one after the other (from the files already downloaded)
+    for _ in range(2):
+        paths = FilePathLoaderFromURL(str(tmp_path), max_workers=4).load_paths(files_data)
+
+        contents = []
+        for path in paths:
+            with open(path, "rb") as file:
+                contents.append(file.read())
+        assert contents == [b"low", b"high", b"first", b"second"]
+
+
+def test_zip_url_without_suffix(http_server, tmp_path):
+    http_server.files["/download?id=3"] = make_zip({"nested/seismic.tif": b"tif"})
+
+    path = FilePathLoaderFromURL(str(tmp_path)).load_path({"url": http_server.url + "/download?id=3", "name": "seismic", "type": ".tif", "archive": ".zip"})
+
+    with open(path, "rb") as file:
+        assert file.read() == b"tif"
@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+    ''' Circuit breaker for the calls to an external service. After failure_threshold consecutive failures the circuit opens and the calls
+        are refused (the caller fails fast) for reset_timeout seconds, then a single trial call is let through: the circuit closes again
+        if it succeeds and stays open for another reset_timeout seconds if it fails'''
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+        # Number of calls refused while the circuit was open
+        self.rejected = 0
+
+    def allow_request(self) -> bool:
+        ''' Return True if the call can be made, False if the caller must fail fast'''
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let a single trial call through (another one after reset_timeout seconds if its outcome is never recorded)
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        ''' Record a successful call, closing the circuit'''
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        ''' Record a failed call, opening the circuit if the trial call failed or there have been too many consecutive failures'''
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def __getstate__(self):
+        # The lock is not sent to other processes, which create their own
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
@@ -1,7 +1,10 @@
 import csv
+import numpy as np
 from api_interfaces.openwheather_API import get_coordinates
 from constants import *
-from haversine import haversine, Unit
+
+# Mean earth radius in kilometers
+EARTH_RADIUS = 6371.0088
 
 
 def process_csv_codes(input_csv: str, output_csv: str):
@@ -62,31 +65,57 @@ def process_csv(input_csv: str, output_csv: str):
 
             #time.sleep(1)  # Sleep for 1 second between requests to avoid hitting API limits
 
-def find_closest_city(latitude: float, longitude: float) -> tuple[str, str]:
-    ''' Return the closest city (and associated administrative unit code) to the geographical coordinates (longitude,latitude)'''
-    closest_city = None
-    min_distance = float('inf')  # Initialize with a very large number
+class Gazetteer:
+    ''' Cities with their administrative unit 2 (ADM2) codes and coordinates, read once from the csv file at file_path'''
 
-    with open(CITIES_WITH_COORDINATES, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.reader(file, delimiter=';')
-        next(reader)  # Skip the header row
+    def __init__(self, file_path: str = CITIES_WITH_COORDINATES):
+        self.file_path = file_path
+        self.adm2_codes = []
+        self.city_names = []
+        latitudes = []
+        longitudes = []
 
-        for row in reader:
-            adm2_code, city, adm1_code, state, adm0_code, country, city_latitude, city_longitude = row
-            # Convert latitude and longitude to float
-            city_latitude = float(city_latitude)
-            city_longitude = float(city_longitude)
+        with open(file_path, 'r', newline='', encoding='utf-8') as file:
+            reader = csv.reader(file, delimiter=';')
+            next(reader)  # Skip the header row
+
+            for row in reader:
+                adm2_code, city, adm1_code, state, adm0_code, country, city_latitude, city_longitude = row
+                self.adm2_codes.append(adm2_code)
+                self.city_names.append(city)
+                latitudes.append(float(city_latitude))
+                longitudes.append(float(city_longitude))
+
+        # Coordinates in radians, used to compute the distances to all the cities at once
+        self.latitudes = np.radians(latitudes)
+        self.longitudes = np.radians(longitudes)
+
+    def find_closest_city(self, latitude: float, longitude: float) -> tuple[str, str]:
+        ''' Return the closest city (and associated administrative unit code) to the geographical coordinates (longitude,latitude)'''
+        if not self.adm2_codes:
+            return None
 
-            # Calculate the distance between the input coordinates and the city's coordinates
-            distance = haversine((latitude, longitude), (city_latitude, city_longitude), unit=Unit.KILOMETERS)
+        # Haversine distance from the input coordinates to each city
+        latitude, longitude = np.radians(latitude), np.radians(longitude)
+        a = np.sin((self.latitudes - latitude) / 2) ** 2 + np.cos(latitude) * np.cos(self.latitudes) * np.sin((self.longitudes - longitude) / 2) ** 2
+        distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
 
-            # Check if this city is closer than the previous closest one
-            if distance < min_distance:
-                min_distance = distance
-                closest_city = (adm2_code, city)
+        # Return the closest city's administrative unit 2 code and city name
+        closest = int(np.argmin(distances))
+        return self.adm2_codes[closest], self.city_names[closest]
+
+
+# Gazetteer used by find_closest_city (read when first needed)
+_default_gazetteer = None
+
+
+def find_closest_city(latitude: float, longitude: float) -> tuple[str, str]:
+    ''' Return the closest city (and associated administrative unit code) to the geographical coordinates (longitude,latitude)'''
+    global _default_gazetteer
+    if _default_gazetteer is None:
+        _default_gazetteer = Gazetteer(CITIES_WITH_COORDINATES)
 
-    # Return the closest city's administrative unit 2 code and city name
-    return closest_city
+    return _default_gazetteer.find_closest_city(latitude, longitude)
 
 
 def find_city_main():
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+
+# Modules that must stay cheap to import, with their import time budget in seconds
+MODULES_BUDGET = {
+    "risk_getters.riskInterfaces": 0.5,
+    "risk_getters.seismic_risk_getters": 0.5,
+    "risk_getters.flood_risk_getters": 0.5,
+    "risk_getters.landslide_risk_getters": 0.5,
+    "risk_getters.main": 0.5,
+}
+
+# Libraries that must only be imported when a map getter or a plot is actually used
+HEAVY_MODULES = ["matplotlib", "geopandas", "shapely", "rasterio", "pandas", "pyproj", "gdown"]
+
+MEASURE_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(name for name in {heavy_modules!r} if name in sys.modules))
+"""
+
+
+def measure_import(module: str, repeat: int = 3) -> tuple[float, list[str]]:
+    ''' Import the module in fresh interpreters and return the best import time and the heavy modules it imported'''
+    best_time = float('inf')
+    heavy_loaded = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", MEASURE_SCRIPT.format(module=module, heavy_modules=HEAVY_MODULES)],
+                                capture_output=True, text=True, check=True).stdout.splitlines()
+        best_time = min(best_time, float(output[0]))
+        heavy_loaded = [name for name in output[1].split(",") if name]
+
+    return best_time, heavy_loaded
+
+
+def main() -> int:
+    ''' Measure the import time of each module and return 1 if one exceeds its budget or imports a heavy library'''
+    failed = False
+    for module, budget in MODULES_BUDGET.items():
+        import_time, heavy_loaded = measure_import(module)
+        ok = import_time <= budget and not heavy_loaded
+        failed = failed or not ok
+
+        print(f"{'OK  ' if ok else 'FAIL'} {module}: {import_time * 1000:.0f} ms (budget {budget * 1000:.0f} ms)"
+              + (f", imports {', '.join(heavy_loaded)}" if heavy_loaded else ""))
+
+    return 1 if failed else 0
+
+
+# Run from the repository root: python -m utility.import_benchmark
+if __name__ == '__main__':
+    sys.exit(main())
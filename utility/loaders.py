@@ -1,52 +1,325 @@
 import shutil
+import hashlib
 from abc import ABC, abstractmethod
-import gdown
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import os
+import tarfile
 import zipfile
 import tempfile
 
+# Files that are part of a shapefile dataset together with the .shp file
+SHAPEFILE_COMPONENTS = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
+
+# Checksums already computed. Keys = (file path, modification time, size) values = checksum
+_checksums = {}
+
+
+# Suffixes of the archives that can be extracted while they are downloaded
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# Suffixes of all the archives that are extracted
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + (".zip",)
+
+
 class FilePathLoader(ABC):
 
+    # Number of files loaded concurrently by load_paths
+    max_workers = 1
+
     @abstractmethod
     def load_path(self, file_data):
         pass
 
+    def load_paths(self, files_data: list) -> list[str]:
+        ''' Return the file paths of the files described by files_data (in the same order), loading up to max_workers of them concurrently'''
+        if self.max_workers <= 1 or len(files_data) <= 1:
+            return [self.load_path(file_data) for file_data in files_data]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(files_data))) as executor:
+            return list(executor.map(self.load_path, files_data))
+
+    def get_checksum(self, file_path: str) -> str:
+        ''' Return the SHA-256 checksum of the dataset at file_path (returned by load_path). For a shapefile all its component files are included'''
+        digest = hashlib.sha256()
+        for path in get_dataset_files(file_path):
+            digest.update(get_file_checksum(path).encode())
+
+        return digest.hexdigest()
+
+    def get_signature(self, file_path: str) -> tuple:
+        ''' Return the modification time and size of the files of the dataset at file_path, which change (cheaply) when the dataset is replaced'''
+        return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in get_dataset_files(file_path))
+
+
+def get_dataset_files(file_path: str) -> list[str]:
+    ''' Return the files of the dataset at file_path: all the component files for a shapefile, the file itself otherwise'''
+    root, extension = os.path.splitext(file_path)
+    if extension.lower() == ".shp":
+        return [root + component for component in SHAPEFILE_COMPONENTS if os.path.exists(root + component)]
+
+    return [file_path]
+
+
+def get_file_checksum(file_path: str) -> str:
+    ''' Return the SHA-256 checksum of a file, the checksum is computed again only if the file has been modified'''
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+
+    if key not in _checksums:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        _checksums[key] = digest.hexdigest()
+
+    return _checksums[key]
+
+
+def verify_checksum(file_path: str, sha256: str):
+    ''' Raise a ValueError if sha256 is given and is not the SHA-256 checksum of the file'''
+    if sha256 is not None and get_file_checksum(file_path) != sha256.lower():
+        raise ValueError(f"Checksum mismatch for {file_path}")
+
+
+def get_archive_suffix(path: str) -> str:
+    ''' Return the archive suffix (see ARCHIVE_SUFFIXES) of path, None if it is not an archive'''
+    for suffix in ARCHIVE_SUFFIXES:
+        if path.lower().endswith(suffix):
+            return suffix
+
+    return None
+
+
+def find_extracted_file(directory: str, member_names: list[str], file_name: str) -> str:
+    ''' Return the path of the archive member named file_name extracted in directory'''
+    for member_name in member_names:
+        if os.path.basename(member_name) == file_name:
+            return os.path.join(directory, member_name)
+
+    raise FileNotFoundError(f"File {file_name} not found in the downloaded archive.")
+
 
 class FilePathLoaderFromGdrive(FilePathLoader):
-    ''' Class used to create a temporary directory and loading there the zip files from google drive'''
-    def __init__(self):
-        self.temp_dir = tempfile.mkdtemp()
+    ''' Class used to create a temporary directory and loading there the zip files from google drive. If download_dir is given the files are
+        downloaded there instead and kept, so that an interrupted download is resumed by the next run'''
+    def __init__(self, download_dir: str = None, max_workers: int = 4):
+        self.remove_dir = download_dir is None
+        self.temp_dir = tempfile.mkdtemp() if download_dir is None else download_dir
+        self.max_workers = max_workers
+        os.makedirs(self.temp_dir, exist_ok=True)
 
     def load_path(self, file_data):
-        ''' Return the file path of the public file described by file_data from google drive'''
+        ''' Return the file path of the public file described by file_data from google drive (the zip is verified if file_data has a 'sha256' checksum)'''
         file_id = file_data['id']
         file_name = file_data['name']
         file_type = file_data['type']
 
-        # Download the zip file containing the file (zip name is equal to file name)
+        import gdown
+
+        # Download the zip file containing the file (zip name is equal to file name), resuming a partial download
         zip_path = os.path.join(self.temp_dir, file_name + ".zip")
-        gdown.download(f'https://drive.google.com/uc?id={file_id}', zip_path, quiet=False)
+        gdown.download(f'https://drive.google.com/uc?id={file_id}', zip_path, quiet=False, resume=True)
+        verify_checksum(zip_path, file_data.get('sha256', None))
 
         # Extract the file
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             zip_ref.extractall(self.temp_dir)
+            member_names = zip_ref.namelist()
 
-        # Find the  file in the extracted files
-        file_path = None
-        for root, dirs, files in os.walk(self.temp_dir):
-            for file in files:
-                if file == file_name + file_type:
-                    file_path = os.path.join(root, file)
-                    break
-
-        if file_path is None:
-            raise FileNotFoundError("File not found in the downloaded zip file.")
-
-        # Return the file path
-        return file_path
+        # Find the file in the extracted files
+        return find_extracted_file(self.temp_dir, member_names, file_name + file_type)
 
     def __del__(self):
         '''Remove the temporary directory and all its contents'''
-        if self.temp_dir:
+        if self.temp_dir and self.remove_dir:
             print(f"Cleaning up temporary directory: {self.temp_dir}")
             shutil.rmtree(self.temp_dir)
+
+
+
+class FilePathLoaderFromURL(FilePathLoader):
+    ''' Class used to download files from HTTP(S) URLs in download_dir (a temporary directory if None), either directly or in a zip or tar archive.
+        file_data is a dictionary with the 'url' of the file or archive, the 'name' and 'type' (extension) of the file and optionally its 'sha256'
+        and the 'archive' suffix (e.g. ".zip", when the url does not end with it). The files of each dataset are named after its name and url,
+        so that different urls with the same file name do not collide. A partial download is resumed with a range request (also by a later run if
+        download_dir is kept), the tar archives are extracted while they are downloaded and load_paths downloads up to max_workers files concurrently.
+        The archives are extracted in a staging directory which replaces the dataset directory only once the checksum has been verified'''
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, download_dir: str = None, max_workers: int = 4, timeout: tuple = (3.05, 60), retries: int = 3):
+        self.remove_dir = download_dir is None
+        self.download_dir = tempfile.mkdtemp() if download_dir is None else download_dir
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        os.makedirs(self.download_dir, exist_ok=True)
+
+    def load_path(self, file_data):
+        ''' Return the file path of the file described by file_data, downloading (and extracting) it if it is not already available'''
+        url = file_data['url']
+        file_name = file_data['name'] + file_data['type']
+        sha256 = file_data.get('sha256', None)
+
+        key = f"{file_data['name']}_{hashlib.sha256(url.encode()).hexdigest()[:16]}"
+        archive_suffix = file_data.get('archive', None) or get_archive_suffix(urlparse(url).path)
+        download_path = os.path.join(self.download_dir, key + (archive_suffix or file_data['type']))
+        extract_dir = os.path.join(self.download_dir, key)
+
+        if archive_suffix is None:
+            self._fetch(url, download_path, sha256)
+            return download_path
+
+        staging_dir = tempfile.mkdtemp(prefix=key + ".", dir=self.download_dir)
+        try:
+            if archive_suffix in TAR_SUFFIXES:
+                member_names = self._fetch(url, download_path, sha256, lambda stream: self._extract_tar(stream, staging_dir))
+            else:
+                self._fetch(url, download_path, sha256)
+                with zipfile.ZipFile(download_path, 'r') as zip_ref:
+                    zip_ref.extractall(staging_dir)
+                    member_names = zip_ref.namelist()
+
+            # The archive has been verified: replace the files of the dataset with the new ones
+            shutil.rmtree(extract_dir, ignore_errors=True)
+            os.replace(staging_dir, extract_dir)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        return find_extracted_file(extract_dir, member_names, file_name)
+
+    def _fetch(self, url: str, download_path: str, sha256: str = None, consume=None):
+        ''' Download url in download_path (see _download) retrying up to retries times, each attempt resuming from the data already received.
+            A file already downloaded is only verified (downloaded again if it does not match the checksum) unless consume needs its content'''
+        import requests
+
+        if os.path.exists(download_path) and consume is None:
+            try:
+                verify_checksum(download_path, sha256)
+                return None
+            except ValueError:
+                os.remove(download_path)
+
+        for attempt in range(self.retries + 1):
+            try:
+                return self._download(url, download_path, sha256, consume)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt == self.retries:
+                    raise
+
+    def _download(self, url: str, download_path: str, sha256: str = None, consume=None):
+        ''' Download url in download_path (through download_path.part, resumed if it exists) and verify its checksum. If consume is given it is called with
+            a file-like stream of the whole content (the part already downloaded followed by the new data) while it is downloaded, and its result is returned'''
+        import requests
+
+        part_path = download_path + ".part"
+        if os.path.exists(download_path):
+            # Already downloaded: only replay it to the consumer
+            os.replace(download_path, part_path)
+            response = None
+        else:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+            response = requests.get(url, headers=headers, stream=True, timeout=self.timeout)
+
+            if response.status_code == 416:
+                # The part file is already complete
+                response.close()
+                response = None
+            elif response.status_code == 200 and offset > 0:
+                # The server does not support range requests, download everything again
+                os.remove(part_path)
+            elif response.status_code not in (200, 206):
+                response.close()
+                response.raise_for_status()
+                raise requests.HTTPError(f"Unexpected status code {response.status_code} for {url}")
+
+        try:
+            with _DownloadStream(part_path, response, self.CHUNK_SIZE) as stream:
+                result = consume(stream) if consume is not None else None
+                stream.read_all()
+        finally:
+            if response is not None:
+                response.close()
+
+        if sha256 is not None and stream.digest.hexdigest() != sha256.lower():
+            os.remove(part_path)
+            raise ValueError(f"Checksum mismatch for {url}")
+
+        os.replace(part_path, download_path)
+        return result
+
+    def _extract_tar(self, stream, extract_dir: str) -> list[str]:
+        ''' Extract the tar archive read from stream in extract_dir and return the names of its members'''
+        # Only regular files and directories inside extract_dir are extracted (when the python version supports it)
+        extract_filter = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+        with tarfile.open(fileobj=stream, mode="r|*") as tar:
+            member_names = []
+            for member in tar:
+                tar.extract(member, extract_dir, **extract_filter)
+                member_names.append(member.name)
+
+        return member_names
+
+    def __del__(self):
+        '''Remove the temporary directory and all its contents'''
+        if self.download_dir and self.remove_dir:
+            shutil.rmtree(self.download_dir, ignore_errors=True)
+
+
+
+class _DownloadStream:
+    ''' Readable stream of a download: the data already in part_path followed by the content of response (if any), which is appended to part_path.
+        The SHA-256 checksum of all the data read is kept in digest'''
+
+    def __init__(self, part_path: str, response, chunk_size: int):
+        self.part_file = open(part_path, 'a+b')
+        self.part_file.seek(0)
+        self.chunks = response.iter_content(chunk_size) if response is not None else iter(())
+        self.chunk_size = chunk_size
+        self.buffer = b""
+        self.replaying = True
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self.buffer += chunk
+
+        if size < 0:
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+
+        return data
+
+    def read_all(self):
+        ''' Read (and save) the rest of the download'''
+        self.buffer = b""
+        while self._next_chunk():
+            pass
+
+    def _next_chunk(self) -> bytes:
+        ''' Return the next chunk of data (empty at the end), from the part file and then from the response'''
+        chunk = b""
+        if self.replaying:
+            chunk = self.part_file.read(self.chunk_size)
+            self.replaying = bool(chunk)
+
+        if not chunk:
+            chunk = next(self.chunks, b"")
+            if chunk:
+                self.part_file.write(chunk)
+
+        self.digest.update(chunk)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.part_file.close()
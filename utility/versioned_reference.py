@@ -0,0 +1,48 @@
+import threading
+from contextlib import contextmanager
+
+
+class VersionedReference:
+    ''' Double-buffered reference to an object (a getter, a gazetteer, ...). The queries use the current version within use(), swap replaces it
+        atomically with a new version already built and waits until the queries still using the old one are over'''
+
+    def __init__(self, value):
+        self.value = value
+        self.version = 0
+
+        # Keys = version values = number of queries using it
+        self.in_flight = {}
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def use(self):
+        ''' Yield the current version of the object, which is not retired by swap until the block is over'''
+        with self.condition:
+            version, value = self.version, self.value
+            self.in_flight[version] = self.in_flight.get(version, 0) + 1
+
+        try:
+            yield value
+        finally:
+            with self.condition:
+                self.in_flight[version] -= 1
+                if self.in_flight[version] == 0:
+                    del self.in_flight[version]
+                    self.condition.notify_all()
+
+    def swap(self, value, timeout: float = None):
+        ''' Make value the current version, wait (at most timeout seconds) until the queries using the old version are over and return it'''
+        with self.condition:
+            old_version, old_value = self.version, self.value
+            self.version, self.value = self.version + 1, value
+
+            self.condition.wait_for(lambda: old_version not in self.in_flight, timeout)
+
+        return old_value
+
+    def __getstate__(self):
+        # Only the current version is sent to other processes
+        return {"value": self.value}
+
+    def __setstate__(self, state):
+        self.__init__(state["value"])